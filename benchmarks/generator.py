@@ -0,0 +1,240 @@
+import lxml.etree as ET
+import random
+from datetime import datetime, timedelta
+from typing import Any, Generator
+
+NAMESPACE = "http://www.portalfiscal.inf.br/nfe"
+SIGNATURE = "http://www.w3.org/2000/09/xmldsig#"
+
+# (xProd, NCM, uCom, cEAN), with the accents and repeated spaces of real notes
+PRODUCTS = (
+    ("Dipirona   sódica 500mg", "30049099", "cx", "7891234567895"),
+    ("Álcool em gel 70%", "22071090", "un", "SEM GTIN"),
+    ("Paracetamol 750mg  c/ 20", "30049069", "cx", "7896004701234"),
+    ("Protetor solar FPS 50", "33049990", "un", "7891010101010"),
+    ("Fralda infantil  tam. G", "96190000", "pct", "7896007912345"),
+    ("Shampoo anticaspa 200ml", "33051000", "un", "7891150012345"),
+    ("Vitamina C efervescente", "21069030", "tb", "7896015512345"),
+    ("Soro fisiológico 0,9%  500ml", "30049099", "fr", "SEM GTIN"),
+    ("Escova dental média", "96032100", "un", "7891528012345"),
+    ("Omeprazol 20mg c/ 28 cápsulas", "30049079", "cx", "7896422512345"),
+)
+
+NATUREZAS = (
+    "Transferência  de mercadoria",
+    "Transferencia de mercadoria",
+    "Transferência entre filiais",
+)
+
+CONTROLE = "TRANSFERENCIA"
+CONTROLE_ESTORNO = "ESTORNO-TRANSFERENCIA"
+
+
+def check_digit(digits: str, weights: list[int]) -> int:
+    total = sum(int(d) * w for d, w in zip(digits, weights))
+    return 0 if total % 11 < 2 else 11 - total % 11
+
+
+def cnpj(root: int) -> str:
+    """Valid CNPJ for the 8 digit ``root``, branch ``0001``."""
+    base = f"{root:08d}0001"
+    first = check_digit(base, [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+    second = check_digit(f"{base}{first}", [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+    return f"{base}{first}{second}"
+
+
+def access_key(
+    emitted: datetime, emitter: str, serie: int, number: int, code: int
+) -> str:
+    """44 digit access key, with the modulo 11 check digit."""
+    key = f"35{emitted:%y%m}{emitter}55{serie:03d}{number:09d}1{code:08d}"
+    weights = [(i % 8) + 2 for i in range(43)][::-1]
+    return f"{key}{check_digit(key, weights)}"
+
+
+def sub(parent: ET._Element, tag: str, text: Any = None, **attrib) -> ET._Element:
+    elm = ET.SubElement(parent, f"{{{NAMESPACE}}}{tag}", attrib)
+    if text is not None:
+        elm.text = str(text)
+    return elm
+
+
+def money(value: float) -> str:
+    return f"{value:.2f}"
+
+
+def add_item(
+    inf: ET._Element, rnd: random.Random, position: int, emitted: datetime, lots: float
+) -> dict[str, float]:
+    name, ncm, unit, ean = rnd.choice(PRODUCTS)
+    qtd = rnd.randint(1, 48)
+    price = round(rnd.uniform(1.5, 120.0), 2)
+    total = round(qtd * price, 2)
+    desc = round(total * rnd.choice((0, 0, 0.02, 0.05)), 2)
+    base = round(total - desc, 2)
+
+    det = sub(inf, "det", nItem=str(position))
+    prod = sub(det, "prod")
+    sub(prod, "cProd", f"{rnd.randint(1000, 9999)}-{rnd.randint(10, 99)}")
+    sub(prod, "cEAN", ean)
+    sub(prod, "xProd", name)
+    sub(prod, "NCM", ncm)
+    sub(prod, "CFOP", 5152)
+    sub(prod, "uCom", unit)
+    sub(prod, "qCom", f"{qtd:.4f}")
+    sub(prod, "vUnCom", f"{price:.10f}")
+    sub(prod, "vProd", money(total))
+    if desc:
+        sub(prod, "vDesc", money(desc))
+
+    if rnd.random() < lots:
+        made = emitted - timedelta(days=rnd.randint(30, 400))
+        rastro = sub(prod, "rastro")
+        sub(rastro, "nLote", f"L{rnd.randint(100, 999)}{rnd.choice('abcXYZ')}")
+        sub(rastro, "qLote", f"{qtd:.3f}")
+        sub(rastro, "dFab", f"{made:%Y-%m-%d}")
+        sub(rastro, "dVal", f"{made + timedelta(days=730):%Y-%m-%d}")
+
+    imposto = sub(det, "imposto")
+    taxes = {"vBC": 0.0, "vICMS": 0.0, "vIPI": 0.0, "vPIS": 0.0, "vCOFINS": 0.0}
+
+    icms = sub(imposto, "ICMS")
+    if rnd.random() < 0.7:
+        group = sub(icms, "ICMS00")
+        sub(group, "orig", 0)
+        sub(group, "CST", "00")
+        sub(group, "modBC", 3)
+        sub(group, "vBC", money(base))
+        sub(group, "pICMS", "18.00")
+        sub(group, "vICMS", money(base * 0.18))
+        taxes["vBC"], taxes["vICMS"] = base, round(base * 0.18, 2)
+    else:
+        group = sub(icms, "ICMS40")
+        sub(group, "orig", rnd.choice((0, 2)))
+        sub(group, "CST", 41)
+
+    if rnd.random() < 0.3:
+        ipi = sub(imposto, "IPI")
+        sub(ipi, "cEnq", 999)
+        group = sub(ipi, "IPITrib")
+        sub(group, "CST", 50)
+        sub(group, "vBC", money(base))
+        sub(group, "pIPI", "5.00")
+        sub(group, "vIPI", money(base * 0.05))
+        taxes["vIPI"] = round(base * 0.05, 2)
+
+    for tax, rate in (("PIS", 0.0165), ("COFINS", 0.076)):
+        node = sub(imposto, tax)
+        if taxes["vICMS"]:
+            group = sub(node, f"{tax}Aliq")
+            sub(group, "CST", "01")
+            sub(group, "vBC", money(base))
+            sub(group, f"p{tax}", f"{rate * 100:.2f}")
+            sub(group, f"v{tax}", money(base * rate))
+            taxes[f"v{tax}"] = round(base * rate, 2)
+        else:
+            sub(sub(node, f"{tax}NT"), "CST", "07")
+
+    return {"vProd": total, "vDesc": desc, **taxes}
+
+
+def generate_note(
+    number: int,
+    items: int = 5,
+    estorno: bool = False,
+    lots: float = 0.5,
+    emitted: datetime = datetime(2025, 4, 1, 10, 15),
+    seed: int = 0,
+) -> tuple[str, str]:
+    """
+    Deterministic NF-e for ``number`` and ``seed``.
+    Args:
+        number (int): Note number, ``nNF``.
+        items (int, optional): Items of the note. Defaults to 5.
+        estorno (bool, optional): Reference a previous note in ``refNFe``.
+            Defaults to False.
+        lots (float, optional): Share of the items with lot and dates
+            (``rastro``). Defaults to 0.5.
+        emitted (datetime, optional): Emission date. Defaults to 2025-04-01.
+        seed (int, optional): Seed of the random values. Defaults to 0.
+    Returns:
+        tuple[str, str]: XML of the note and its access key.
+    """
+    rnd = random.Random(f"{seed}:{number}")
+    emitter, destination = cnpj(12345678), cnpj(rnd.randint(10**7, 10**8 - 1))
+    serie = rnd.randint(1, 3)
+    key = access_key(emitted, emitter, serie, number, rnd.randint(0, 10**8 - 1))
+
+    root = ET.Element(f"{{{NAMESPACE}}}NFe", nsmap={None: NAMESPACE})
+    inf = sub(root, "infNFe", Id=f"NFe{key}", versao="4.00")
+
+    ide = sub(inf, "ide")
+    sub(ide, "cUF", 35)
+    sub(ide, "natOp", rnd.choice(NATUREZAS))
+    sub(ide, "mod", 55)
+    sub(ide, "serie", serie)
+    sub(ide, "nNF", number)
+    sub(ide, "dhEmi", f"{emitted:%Y-%m-%dT%H:%M:%S}-03:00")
+    if estorno:
+        ref = access_key(emitted - timedelta(days=30), emitter, serie, number, 0)
+        sub(sub(ide, "NFref"), "refNFe", ref)
+
+    emit = sub(inf, "emit")
+    sub(emit, "CNPJ", emitter)
+    sub(emit, "xNome", "Drogaria São João")
+    dest = sub(inf, "dest")
+    sub(dest, "CNPJ", destination)
+    sub(dest, "xNome", "Centro de Distribuição")
+
+    totals = [add_item(inf, rnd, n, emitted, lots) for n in range(1, items + 1)]
+
+    def total(name: str) -> str:
+        return money(sum(item[name] for item in totals))
+
+    icms = sub(sub(inf, "total"), "ICMSTot")
+    for name in ("vBC", "vICMS", "vProd", "vDesc", "vIPI", "vPIS", "vCOFINS"):
+        sub(icms, name, total(name))
+    sub(icms, "vNF", money(sum(i["vProd"] - i["vDesc"] + i["vIPI"] for i in totals)))
+    sub(sub(inf, "transp"), "modFrete", 9)
+
+    signature = ET.SubElement(
+        root, f"{{{SIGNATURE}}}Signature", nsmap={None: SIGNATURE}
+    )
+    ET.SubElement(signature, f"{{{SIGNATURE}}}SignedInfo")
+
+    return ET.tostring(root, encoding="unicode"), key
+
+
+def generate_rows(
+    notes: int,
+    items: int = 5,
+    estorno: float = 0.1,
+    lots: float = 0.5,
+    start: datetime = datetime(2025, 4, 1),
+    days: int = 1,
+    seed: int = 0,
+) -> Generator[tuple, Any, None]:
+    """
+    Rows shaped like ``connect.iter_notes``: ``(dscXml, codChaveAcesso,
+    isnStatus, dthGravacao, controle1)``, spread over ``days`` days.
+    Args:
+        notes (int): Number of notes.
+        items (int, optional): Items per note. Defaults to 5.
+        estorno (float, optional): Share of estorno notes. Defaults to 0.1.
+        lots (float, optional): Share of the items with lots. Defaults to 0.5.
+        start (datetime, optional): First day. Defaults to 2025-04-01.
+        days (int, optional): Days covered by the notes. Defaults to 1.
+        seed (int, optional): Seed of the random values. Defaults to 0.
+    """
+    step = timedelta(days=days) / max(notes, 1)
+
+    for number in range(1, notes + 1):
+        rnd = random.Random(f"{seed}:row:{number}")
+        emitted = start + step * (number - 1)
+        is_estorno = rnd.random() < estorno
+
+        xml, key = generate_note(number, items, is_estorno, lots, emitted, seed)
+        recorded = emitted + timedelta(minutes=rnd.randint(1, 30))
+        controle = CONTROLE_ESTORNO if is_estorno else CONTROLE
+
+        yield xml, key, 1, recorded, controle
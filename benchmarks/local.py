@@ -0,0 +1,48 @@
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Generator
+
+BUCKET = "bench-xml-aws-athena"
+
+
+def memory_notes(
+    rows: list[tuple], tips: list[str], start: datetime, end: datetime
+) -> Generator[tuple, Any, None]:
+    """
+    Stand-in for ``connect.iter_notes`` over rows kept in memory, with the
+    same ``controle1`` and ``dthGravacao`` filter as ``query_notes``.
+    """
+    lower = datetime(start.year, start.month, start.day)
+    upper = datetime(end.year, end.month, end.day) + timedelta(days=1)
+
+    for row in rows:
+        if row[4] in tips and lower <= row[3] < upper:
+            yield row
+
+
+@contextmanager
+def local_s3():
+    """
+    In-memory S3 (moto) for ``raw.comand_raw``, called with ``bucket=BUCKET``
+    and ``source=memory_notes(...)`` in place of the SQL Server query.
+    """
+    from moto import mock_aws
+
+    environ = {
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "AWS_DEFAULT_REGION": "us-east-1",
+    }
+    previous = {name: os.environ.get(name) for name in environ}
+    os.environ.update(environ)
+
+    try:
+        with mock_aws():
+            yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
@@ -0,0 +1,306 @@
+"""
+Benchmarks of the parsing and loading stages over synthetic NF-e.
+
+    python -m benchmarks.run --notes 500 --items 5
+
+Results are written as JSON to ``benchmarks/results`` and compared with the
+latest previous run made with the same parameters.
+"""
+
+import argparse
+import json
+import logging
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Callable, NamedTuple
+
+from benchmarks.generator import CONTROLE, CONTROLE_ESTORNO, generate_rows
+from benchmarks.local import BUCKET, local_s3, memory_notes
+from xml_aws_athena import raw, silver
+from xml_aws_athena.builder import SpillBuffer
+from xml_aws_athena.parser import FileXml, ParseXml
+from xml_aws_athena.schema import schema_compact
+import xml_aws_athena.write as Write
+
+logger = logging.getLogger("benchmarks")
+
+RESULTS = Path(__file__).parent / "results"
+SAMPLE = Path(__file__).parent.parent / "tests" / "data" / "nfe.xml"
+
+
+class Benchmark(NamedTuple):
+    name: str
+    run: Callable[[], Any]
+    setup: Callable[[], Any] = None
+
+
+def measure(benchmark: Benchmark, notes: int, repeat: int = 3) -> dict:
+    """
+    Best and median time of ``repeat`` runs, after one warm up run.
+    """
+    times = []
+
+    for run in range(repeat + 1):
+        if benchmark.setup:
+            benchmark.setup()
+
+        start = perf_counter()
+        benchmark.run()
+        elapsed = perf_counter() - start
+
+        if run:
+            times.append(elapsed)
+
+    best = min(times)
+
+    return {
+        "notes": notes,
+        "repeat": repeat,
+        "best": best,
+        "median": statistics.median(times),
+        "us_per_note": best / notes * 1e6,
+        "notes_per_s": notes / best,
+    }
+
+
+def parse_benchmarks(rows: list[tuple]) -> list[Benchmark]:
+    # the sample note of the tests, parsed as many times as there are rows
+    sample = SAMPLE.read_text(encoding="utf-8")
+    samples = [(sample, None, 1, None, "TRANSFERENCIA")] * len(rows)
+
+    def parse(notes: list[tuple], stream: bool) -> Callable[[], None]:
+        def run() -> None:
+            for xml, __, instatus, __, controle in notes:
+                list(ParseXml(controle, instatus, xml, stream=stream).records())
+
+        return run
+
+    return [
+        Benchmark("ParseXml[tree]", parse(rows, False)),
+        Benchmark("ParseXml[stream]", parse(rows, True)),
+        Benchmark("ParseXml[tree,sample]", parse(samples, False)),
+        Benchmark("ParseXml[stream,sample]", parse(samples, True)),
+    ]
+
+
+def export_benchmarks(rows: list[tuple]) -> list[Benchmark]:
+    def export(**kwargs) -> Callable[[], None]:
+        def run() -> None:
+            for row in rows:
+                FileXml(*row).export_file_xml(**kwargs)
+
+        return run
+
+    return [
+        Benchmark("FileXml.export_file_xml", export()),
+        Benchmark(
+            "FileXml.export_file_xml[passthrough,gzip]",
+            export(passthrough=True, codec="gzip"),
+        ),
+    ]
+
+
+def silver_benchmarks(rows: list[tuple], path: str) -> list[Benchmark]:
+    rst = [*enumerate(rows)]
+    table = silver.read_parquet_temp(rst, compact=True)
+
+    def write() -> None:
+        with SpillBuffer(schema_compact) as buffer:
+            for batch in table.to_batches():
+                buffer.write(batch)
+
+            silver.write_silver(buffer, len(rows))
+
+    def drop() -> None:
+        shutil.rmtree(Path(path) / "silver", ignore_errors=True)
+
+    def create_once() -> None:
+        if not Write.is_delta_table():
+            write()
+
+    return [
+        Benchmark(
+            "silver.read_parquet_temp[thread]", lambda: silver.read_parquet_temp(rst)
+        ),
+        Benchmark(
+            "silver.read_parquet_temp[process]",
+            lambda: silver.read_parquet_temp(rst, engine="process"),
+        ),
+        Benchmark("silver.write_silver[create]", write, drop),
+        Benchmark("silver.write_silver[merge]", write, create_once),
+    ]
+
+
+def raw_benchmarks(rows: list[tuple]) -> list[Benchmark]:
+    start = min(row[3] for row in rows)
+    end = max(row[3] for row in rows)
+
+    tips = [CONTROLE, CONTROLE_ESTORNO]
+
+    def comand(**kwargs) -> Callable[[], None]:
+        return lambda: raw.comand_raw(
+            "local",
+            "bench",
+            tips,
+            start,
+            end,
+            bucket=BUCKET,
+            source=memory_notes(rows, tips, start, end),
+            **kwargs,
+        )
+
+    return [
+        Benchmark("raw.comand_raw", comand()),
+        Benchmark(
+            "raw.comand_raw[passthrough,gzip]", comand(passthrough=True, codec="gzip")
+        ),
+        Benchmark("raw.comand_raw[packed,gzip]", comand(packed="gzip")),
+    ]
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_all(params: dict, repeat: int = 3, only: str = None) -> dict[str, dict]:
+    """
+    Generate the notes and run every benchmark whose name contains ``only``.
+    """
+    rows = [*generate_rows(**params)]
+    results = {}
+
+    def run(benchmarks: list[Benchmark]) -> None:
+        for benchmark in benchmarks:
+            if only and only not in benchmark.name:
+                continue
+
+            result = measure(benchmark, len(rows), repeat)
+            results[benchmark.name] = result
+            logger.info(
+                f"{benchmark.name:<45} {result['best']:8.3f}s "
+                f"{result['us_per_note']:10.1f} us/nota "
+                f"{result['notes_per_s']:10.1f} notas/s"
+            )
+
+    run(parse_benchmarks(rows))
+    run(export_benchmarks(rows))
+
+    with (
+        tempfile.TemporaryDirectory(prefix="bench_delta") as path,
+        Write.use_table(f"{path}/silver/notas"),
+    ):
+        run(silver_benchmarks(rows, path))
+
+    with local_s3():
+        run(raw_benchmarks(rows))
+
+    return results
+
+
+def latest_result(directory: Path, params: dict) -> dict | None:
+    """Latest result file in ``directory`` made with the same ``params``."""
+    for file in sorted(directory.glob("*.json"), reverse=True):
+        result = json.loads(file.read_text())
+        if result.get("params") == params:
+            return result
+
+    return None
+
+
+def compare(previous: dict, current: dict, tolerance: float = 0.1) -> list[str]:
+    """
+    Benchmarks whose best time grew more than ``tolerance`` since ``previous``.
+    """
+    regressions = []
+
+    for name, result in current["results"].items():
+        if not (before := previous["results"].get(name)):
+            continue
+
+        ratio = result["best"] / before["best"]
+        logger.info(
+            f"{name:<45} {ratio:6.2f}x  ({previous['commit']} -> {current['commit']})"
+        )
+
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+
+    return regressions
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notes", type=int, default=200)
+    parser.add_argument("--items", type=int, default=5)
+    parser.add_argument("--estorno", type=float, default=0.1)
+    parser.add_argument("--lots", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", help="Run only the benchmarks containing this text")
+    parser.add_argument("--output", type=Path, default=RESULTS)
+    parser.add_argument("--baseline", type=Path, help="Result file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument(
+        "--strict", action="store_true", help="Exit with 1 on regressions"
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    logger.setLevel(logging.INFO)
+
+    params = {
+        "notes": args.notes,
+        "items": args.items,
+        "estorno": args.estorno,
+        "lots": args.lots,
+        "seed": args.seed,
+    }
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    if args.baseline:
+        previous = json.loads(args.baseline.read_text())
+    else:
+        previous = latest_result(args.output, params)
+
+    created = datetime.now()
+    current = {
+        "created": created.isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "params": params,
+        "results": run_all(params, args.repeat, args.only),
+    }
+
+    file = args.output / f"{created:%Y%m%dT%H%M%S}.json"
+    file.write_text(json.dumps(current, indent=2))
+    logger.info(f"Resultados em {file}")
+
+    if previous is None:
+        return 0
+
+    if regressions := compare(previous, current, args.tolerance):
+        logger.warning(
+            f"Regressões acima de {args.tolerance:.0%}: {', '.join(regressions)}"
+        )
+        return 1 if args.strict else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+import tempfile
+from typing import Any, Generator, Iterable
+from xml_aws_athena.schema import schema_compact
+
+
+class BatchBuilder:
+    """
+    Columnar builder of ``pa.RecordBatch`` for many notes.
+
+    Parsed values are appended straight into one buffer per column of
+    ``schema`` and typed once, when the batch is flushed. Dictionary columns
+    of ``schema`` are encoded by Arrow while typing.
+    """
+
+    def __init__(self, schema: pa.Schema = schema_compact) -> None:
+        self.schema = schema
+        self.columns: dict[str, list] = {name: [] for name in schema.names}
+        self.num_rows = 0
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def append(self, file: Any) -> int:
+        """
+        Append the items of a note to the column buffers.
+        Args:
+            file (ParseXml): Parsed note.
+        Returns:
+            int: Number of rows appended.
+        """
+        items = [*file.items()]
+        if not items:
+            return 0
+
+        header = file.header
+        rows = len(items)
+
+        for name, values in self.columns.items():
+            if name in header:
+                values.extend([header[name]] * rows)
+            else:
+                values.extend([data.get(name) for data in items])
+
+        self.num_rows += rows
+        return rows
+
+    def flush(self) -> pa.RecordBatch:
+        """
+        Type the buffered columns into a ``pa.RecordBatch`` and reset the builder.
+        """
+        arrays = [pa.array(self.columns[f.name], type=f.type) for f in self.schema]
+        batch = pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+        self.columns = {name: [] for name in self.schema.names}
+        self.num_rows = 0
+
+        return batch
+
+
+def normalize_strings(array: pa.Array) -> pa.Array:
+    """
+    Vectorized ``ParseXml.clear_string``: strip accents, collapse repeated
+    spaces, trim and upper case a whole string column with Arrow kernels.
+    """
+    array = pc.utf8_normalize(array, "NFD")
+    array = pc.replace_substring_regex(array, r"\p{Mn}+", "")
+    array = pc.utf8_normalize(array, "NFC")
+    array = pc.replace_substring_regex(array, r" +", " ")
+    array = pc.utf8_trim_whitespace(array)
+    return pc.utf8_upper(array)
+
+
+def normalize_dictionary(array: pa.DictionaryArray) -> pa.DictionaryArray:
+    """
+    Normalize only the distinct values of a dictionary column, then merge
+    the values that became equal, e.g. ``Álcool`` and ``ALCOOL``.
+    """
+    values = normalize_strings(array.dictionary).dictionary_encode()
+    indices = pc.take(values.indices, array.indices)
+
+    return pa.DictionaryArray.from_arrays(indices, values.dictionary)
+
+
+def normalize_column(array: pa.Array) -> pa.Array:
+    if pa.types.is_dictionary(array.type):
+        return normalize_dictionary(array)
+
+    return normalize_strings(array)
+
+
+def is_string(dtype: pa.DataType) -> bool:
+    if pa.types.is_dictionary(dtype):
+        dtype = dtype.value_type
+
+    return pa.types.is_string(dtype)
+
+
+def normalize_batch(
+    batch: pa.RecordBatch, skip: tuple[str, ...] = ("controle",)
+) -> pa.RecordBatch:
+    """
+    Normalize every string column of a finished batch. Dictionary columns
+    clean each distinct raw string once per batch.
+    Args:
+        batch (pa.RecordBatch): Batch built from notes parsed with ``clean=False``.
+        skip (tuple[str, ...], optional): Columns kept as they are.
+            Defaults to ("controle",).
+    """
+    arrays = [
+        normalize_column(column)
+        if is_string(field.type) and field.name not in skip
+        else column
+        for field, column in zip(batch.schema, batch.columns)
+    ]
+
+    return pa.RecordBatch.from_arrays(arrays, schema=batch.schema)
+
+
+def iter_batches(
+    files: Iterable[Any],
+    max_rows: int = 64_000,
+    schema: pa.Schema = schema_compact,
+    normalize: bool = False,
+) -> Generator[pa.RecordBatch, Any, None]:
+    """
+    Build record batches of up to about ``max_rows`` rows from parsed notes.
+    Args:
+        files (Iterable[ParseXml]): Parsed notes.
+        max_rows (int, optional): Rows that trigger a flush. Defaults to 64_000.
+        schema (pa.Schema, optional): Batch schema. Defaults to schema_compact.
+        normalize (bool, optional): Run ``normalize_batch`` on every batch, for
+            notes parsed with ``clean=False``. Defaults to False.
+    """
+    builder = BatchBuilder(schema)
+
+    def flush() -> pa.RecordBatch:
+        batch = builder.flush()
+        return normalize_batch(batch) if normalize else batch
+
+    for file in files:
+        builder.append(file)
+
+        if len(builder) >= max_rows:
+            yield flush()
+
+    if len(builder):
+        yield flush()
+
+
+class SpillBuffer:
+    """
+    Collect record batches in memory and spill them to an Arrow IPC stream
+    once ``memory_budget`` bytes is exceeded.
+
+    ``reader()``, called after the last ``write``, streams the batches back,
+    memory mapped from disk when spilled, and can be called again for another
+    pass. Use it as a context manager, the spill file is removed on exit.
+    """
+
+    def __init__(self, schema: pa.Schema, memory_budget: int = None) -> None:
+        self.schema = schema
+        self.memory_budget = memory_budget
+        self.batches: list[pa.RecordBatch] = []
+        self.nbytes = 0
+        self.num_rows = 0
+        self.tmpdir = None
+        self.writer = None
+
+    @property
+    def spilled(self) -> bool:
+        return self.tmpdir is not None
+
+    @property
+    def path(self) -> str:
+        return f"{self.tmpdir.name}/spill.arrow"
+
+    def write(self, batch: pa.RecordBatch) -> None:
+        self.nbytes += batch.nbytes
+        self.num_rows += batch.num_rows
+
+        if self.spilled:
+            self.writer.write_batch(batch)
+            return
+
+        self.batches.append(batch)
+
+        if self.memory_budget is not None and self.nbytes > self.memory_budget:
+            self.__spill()
+
+    def __spill(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory(
+            prefix="xml_spill", ignore_cleanup_errors=True
+        )
+        # the stream format, unlike the file format, accepts a new dictionary per batch
+        self.writer = pa.ipc.new_stream(self.path, self.schema)
+
+        for batch in self.batches:
+            self.writer.write_batch(batch)
+
+        self.batches = []
+
+    def reader(self) -> pa.RecordBatchReader:
+        if not self.spilled:
+            return pa.RecordBatchReader.from_batches(self.schema, self.batches)
+
+        self.__close_writer()
+        return pa.ipc.open_stream(pa.memory_map(self.path))
+
+    def __close_writer(self) -> None:
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+    def close(self) -> None:
+        self.__close_writer()
+
+        if self.tmpdir:
+            self.tmpdir.cleanup()
+
+        self.batches = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
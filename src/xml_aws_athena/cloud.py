@@ -1,13 +1,98 @@
 import boto3
+from boto3.exceptions import S3UploadFailedError
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
+import os
+import time
 import logging
+import threading
 from io import BytesIO
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+from xml_aws_athena import config
+
+MAX_POOL_CONNECTIONS = int(
+    config.get("s3_max_pool_connections", max(10, 2 * os.cpu_count()))
+)
+MAX_ATTEMPTS = int(config.get("s3_max_attempts", 10))
+MULTIPART_THRESHOLD = int(config.get("s3_multipart_threshold", 16 * 2**20))
+
+
+class UploadMetrics:
+    """Calls, bytes, errors and latency of the uploads of a ``Storage``."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.bytes = 0
+        self.errors = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, size: int, elapsed: float, ok: bool = True) -> None:
+        with self.lock:
+            self.calls += 1
+            self.bytes += size
+            self.errors += not ok
+            self.latency += elapsed
+            self.max_latency = max(self.max_latency, elapsed)
+
+    @property
+    def avg_latency(self) -> float:
+        return self.latency / self.calls if self.calls else 0.0
+
+    def __repr__(self) -> str:
+        return (
+            f"UploadMetrics(calls={self.calls}, mb={self.bytes / 2**20:.1f}, "
+            f"errors={self.errors}, avg={self.avg_latency * 1000:.1f}ms, "
+            f"max={self.max_latency * 1000:.1f}ms)"
+        )
+
+
+def body_size(body: bytes | BytesIO) -> int:
+    if isinstance(body, BytesIO):
+        return body.getbuffer().nbytes
+
+    return len(body)
 
 
 class Storage:
-    def __init__(self, **kwargs) -> None:
+    def __init__(
+        self,
+        max_pool_connections: int = MAX_POOL_CONNECTIONS,
+        max_attempts: int = MAX_ATTEMPTS,
+        multipart_threshold: int = MULTIPART_THRESHOLD,
+        **kwargs,
+    ) -> None:
+        """
+        S3 client with a connection pool of ``max_pool_connections`` and
+        adaptive retries, so it can be shared by as many upload threads.
+        Args:
+            max_pool_connections (int, optional): Size of the connection pool.
+            max_attempts (int, optional): Attempts of each call, with adaptive
+                backoff on throttling.
+            multipart_threshold (int, optional): Payloads from this size up are
+                sent as multipart uploads.
+            **kwargs: Passed to ``boto3.client``.
+        """
         self.kwargs = kwargs
-        self.s3_client = boto3.client("s3", **kwargs)
+        self.max_pool_connections = max_pool_connections
+        self.metrics = UploadMetrics()
+        self.transfer = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=max(multipart_threshold // 2, 5 * 2**20),
+        )
+
+        client_config = Config(
+            max_pool_connections=max_pool_connections,
+            retries={"max_attempts": max_attempts, "mode": "adaptive"},
+        )
+        if "config" in kwargs:
+            client_config = client_config.merge(kwargs.pop("config"))
+
+        self.s3_client = boto3.client("s3", config=client_config, **kwargs)
 
     def create_bucket(self, bucket_name: str, region: str = None) -> bool:
         """
@@ -64,14 +149,125 @@ class Storage:
             return False
 
     def put_object_file(
-        self, body: str | BytesIO, bucket_name: str, object_key: str
+        self,
+        body: str | bytes | BytesIO,
+        bucket_name: str,
+        object_key: str,
+        content_encoding: str = None,
     ) -> bool:
         """
-        Upload a file to an S3 bucket.
+        Upload a file to an S3 bucket, with the ``Content-Encoding`` of a
+        compressed body. Payloads from ``multipart_threshold`` up are sent
+        as multipart uploads.
         """
+        extra = {"ContentEncoding": content_encoding} if content_encoding else {}
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+
+        size = body_size(body)
+        start = time.perf_counter()
+
         try:
-            self.s3_client.put_object(Bucket=bucket_name, Key=object_key, Body=body)
+            if size >= self.transfer.multipart_threshold:
+                if not isinstance(body, BytesIO):
+                    body = BytesIO(body)
+
+                self.s3_client.upload_fileobj(
+                    body, bucket_name, object_key, ExtraArgs=extra, Config=self.transfer
+                )
+            else:
+                self.s3_client.put_object(
+                    Bucket=bucket_name, Key=object_key, Body=body, **extra
+                )
+
+            self.metrics.add(size, time.perf_counter() - start)
             return True
-        except ClientError as e:
+        except (ClientError, S3UploadFailedError) as e:
+            self.metrics.add(size, time.perf_counter() - start, ok=False)
             logging.error(f"Error uploading file to S3: {e}")
             return False
+
+    def put_objects(
+        self,
+        objects: Iterable[tuple],
+        bucket_name: str,
+        workers: int = None,
+    ) -> list[bool]:
+        """
+        Upload many objects on a bounded number of threads.
+        Args:
+            objects (Iterable[tuple]): ``(body, object_key)`` or
+                ``(body, object_key, content_encoding)`` tuples, consumed lazily.
+            bucket_name (str): Bucket name.
+            workers (int, optional): Concurrent uploads. Defaults to
+                ``max_pool_connections``.
+        Returns:
+            list[bool]: Result of each upload, in the order of ``objects``.
+        """
+        workers = min(workers or self.max_pool_connections, self.max_pool_connections)
+        calls, size, start = self.metrics.calls, self.metrics.bytes, time.perf_counter()
+
+        result = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+
+            for obj in objects:
+                pending.append(
+                    executor.submit(self.put_object_file, obj[0], bucket_name, *obj[1:])
+                )
+
+                if len(pending) >= workers * 2:
+                    result.append(pending.popleft().result())
+
+            result.extend(future.result() for future in pending)
+
+        elapsed = time.perf_counter() - start
+        mb = (self.metrics.bytes - size) / 2**20
+        rate = mb / elapsed if elapsed else 0
+        logging.info(
+            f"Upload de {self.metrics.calls - calls} objetos, {mb:.1f} MB em "
+            f"{elapsed:.2f}s ({rate:.1f} MB/s), {self.metrics}"
+        )
+
+        return result
+
+    def get_object_file(
+        self,
+        bucket_name: str,
+        object_key: str,
+        byte_range: tuple[int, int] = None,
+    ) -> bytes | None:
+        """
+        Download an object, or the inclusive ``byte_range`` of it, from an S3 bucket.
+        Returns None when the object does not exist.
+        """
+        kwargs = {"Bucket": bucket_name, "Key": object_key}
+        if byte_range:
+            kwargs["Range"] = "bytes={}-{}".format(*byte_range)
+
+        try:
+            response = self.s3_client.get_object(**kwargs)
+            return response["Body"].read()
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+                logging.error(f"Error downloading file from S3: {e}")
+            return None
+
+    def get_object_stream(self, bucket_name: str, object_key: str):
+        """
+        Open an object of an S3 bucket as a stream (``StreamingBody``).
+        """
+        response = self.s3_client.get_object(Bucket=bucket_name, Key=object_key)
+        return response["Body"]
+
+    def list_objects(self, bucket_name: str, prefix: str = "") -> list[str]:
+        """
+        List the keys of an S3 bucket under ``prefix``.
+        """
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+
+        return [
+            obj["Key"]
+            for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix)
+            for obj in page.get("Contents", [])
+        ]
@@ -0,0 +1,37 @@
+import gzip
+from typing import Literal
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+Codec = Literal["gzip", "zstd"]
+
+# ``Content-Encoding`` / file suffix of each codec
+CONTENT_ENCODING = {"gzip": "gzip", "zstd": "zstd"}
+SUFFIX = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def _zstd():
+    if zstandard is None:
+        raise ImportError("Instale o pacote zstandard para usar a compressão zstd")
+
+    return zstandard
+
+
+def compress(data: bytes, codec: Codec = "zstd", level: int = 3) -> bytes:
+    """
+    Compress ``data`` as one self-contained gzip member or zstd frame.
+    """
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=min(level, 9), mtime=0)
+
+    return _zstd().ZstdCompressor(level=level).compress(data)
+
+
+def decompress(data: bytes, codec: Codec = "zstd") -> bytes:
+    if codec == "gzip":
+        return gzip.decompress(data)
+
+    return _zstd().ZstdDecompressor().decompress(data)
@@ -1,16 +1,35 @@
 from contextlib import contextmanager
 import pyodbc
-from datetime import datetime
+from datetime import datetime, timedelta
+from queue import Queue, Empty, Full
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from time import perf_counter
+from typing import Any, Generator, Literal
+from itertools import islice
+import logging
+import threading
 
+logger = logging.getLogger(__name__)
 
-@contextmanager
-def do_connect(*args, **kwargs):
+# batches buffered per shard of ``iter_notes_sharded``
+SHARD_BATCHES = 2
+SHARD_DONE = object()
+
+
+def open_connection(*args, **kwargs) -> pyodbc.Connection:
     con = pyodbc.connect(*args, **kwargs)
     con.autocommit = True
 
     con.set_attr(pyodbc.SQL_ATTR_TXN_ISOLATION, pyodbc.SQL_TXN_READ_UNCOMMITTED)
 
     con.autocommit = False
+    return con
+
+
+@contextmanager
+def do_connect(*args, **kwargs):
+    con = open_connection(*args, **kwargs)
     cursor = con.cursor()
 
     try:
@@ -25,16 +44,8 @@ def do_connect(*args, **kwargs):
         con.close()
 
 
-def iter_notes(
-    server,
-    database,
-    *,
-    tips: list[str],
-    start: datetime,
-    end: datetime,
-    font: str = "dbnfe",
-):
-    DRIVER = (
+def driver(server: str, database: str) -> str:
+    return (
         "Driver={ODBC Driver 18 for Sql Server};"
         f"Server={server};"
         f"Database={database};"
@@ -42,6 +53,8 @@ def iter_notes(
         "Authentication=ActiveDirectoryIntegrated;"
     )
 
+
+def query_notes(tips: list[str], start: datetime, end: datetime, font: str) -> str:
     query = """
     select dscXml, codChaveAcesso, isnStatus, dthGravacao, controle1 
     from {font}.dbo.tbNfeXml 
@@ -56,8 +69,373 @@ def iter_notes(
         "font": font,
     }
 
-    with do_connect(DRIVER) as cursor:
-        cursor.execute(query.format(**params))
+    return query.format(**params)
+
+
+def query_range(tips: list[str], start: datetime, end: datetime, font: str) -> str:
+    """
+    Notes with ``start <= dthGravacao < end``, in a stable order.
+    """
+    query = """
+    select dscXml, codChaveAcesso, isnStatus, dthGravacao, controle1 
+    from {font}.dbo.tbNfeXml 
+    where controle1 in({tips}) and isnstatus is not null and codChaveAcesso is not null 
+    and dthGravacao >= '{start:%Y-%m-%d %H:%M:%S}' and dthGravacao < '{end:%Y-%m-%d %H:%M:%S}' 
+    and convert(VARCHAR(MAX), dscXml) != '' 
+    order by dthGravacao, codChaveAcesso, isnStatus """
+
+    params = {
+        "tips": ",".join(f"{c!r}" for c in tips),
+        "start": start,
+        "end": end,
+        "font": font,
+    }
+
+    return query.format(**params)
+
+
+class FetchMetrics:
+    """Rows, XML size (characters of ``dscXml``) and time spent fetching."""
+
+    def __init__(self) -> None:
+        self.rows = 0
+        self.chars = 0
+        self.fetches = 0
+        self.elapsed = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, rows: list, elapsed: float) -> None:
+        size = sum(len(row[0] or "") for row in rows)
+
+        with self.lock:
+            self.rows += len(rows)
+            self.chars += size
+            self.fetches += 1
+            self.elapsed += elapsed
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def mchars_per_sec(self) -> float:
+        return self.chars / 2**20 / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self) -> str:
+        return (
+            f"FetchMetrics(rows={self.rows}, mchars={self.chars / 2**20:.1f}, "
+            f"fetches={self.fetches}, {self.rows_per_sec:.0f} rows/s, "
+            f"{self.mchars_per_sec:.1f} Mchars/s)"
+        )
+
+
+def fetch_batches(
+    cursor: pyodbc.Cursor,
+    batch_rows: int = 1_000,
+    batch_chars: int = None,
+    metrics: FetchMetrics = None,
+) -> Generator[list[pyodbc.Row], Any, None]:
+    """
+    Fetch the result of an executed cursor in batches.
+    Args:
+        cursor (pyodbc.Cursor): Cursor with an executed query.
+        batch_rows (int, optional): Rows per ``fetchmany`` round trip, and per
+            batch without ``batch_chars``. Defaults to 1_000.
+        batch_chars (int, optional): Close a batch once its ``dscXml`` values
+            reach this many characters, regrouping the rows of the round trips:
+            a batch may span several round trips or take part of one.
+            Defaults to None.
+        metrics (FetchMetrics, optional): Updated with each round trip.
+    """
+    metrics = FetchMetrics() if metrics is None else metrics
+    cursor.arraysize = batch_rows
+
+    batch, size = [], 0
+
+    while True:
+        start = perf_counter()
+        rows = cursor.fetchmany(batch_rows)
+        metrics.add(rows, perf_counter() - start)
+
+        if not rows:
+            break
+
+        if batch_chars is None:
+            yield rows
+            continue
+
+        for row in rows:
+            batch.append(row)
+            size += len(row[0] or "")
+
+            if size >= batch_chars:
+                yield batch
+                batch, size = [], 0
+
+    if batch:
+        yield batch
+
+
+def iter_note_batches(
+    server,
+    database,
+    *,
+    tips: list[str],
+    start: datetime,
+    end: datetime,
+    font: str = "dbnfe",
+    batch_rows: int = 1_000,
+    batch_chars: int = None,
+    metrics: FetchMetrics = None,
+) -> Generator[list[pyodbc.Row], Any, None]:
+    """
+    Query the notes and yield them in batches sized by row count or by total
+    XML characters, see ``fetch_batches``.
+    """
+    metrics = FetchMetrics() if metrics is None else metrics
+
+    with do_connect(driver(server, database)) as cursor:
+        cursor.execute(query_notes(tips, start, end, font))
+
+        yield from fetch_batches(cursor, batch_rows, batch_chars, metrics)
+
+    logger.info(f"Leitura concluída: {metrics}")
+
+
+def iter_notes(
+    server,
+    database,
+    *,
+    tips: list[str],
+    start: datetime,
+    end: datetime,
+    font: str = "dbnfe",
+    batch_rows: int = 1_000,
+):
+    for rows in iter_note_batches(
+        server,
+        database,
+        tips=tips,
+        start=start,
+        end=end,
+        font=font,
+        batch_rows=batch_rows,
+    ):
+        yield from rows
+
+
+def iter_notes_range(
+    server,
+    database,
+    *,
+    tips: list[str],
+    start: datetime,
+    end: datetime,
+    font: str = "dbnfe",
+    batch_rows: int = 1_000,
+) -> Generator[pyodbc.Row, Any, None]:
+    """
+    Notes with ``start <= dthGravacao < end`` at full time precision, ordered
+    by ``dthGravacao``. Used by the incremental extraction.
+    """
+    metrics = FetchMetrics()
+
+    with do_connect(driver(server, database)) as cursor:
+        cursor.execute(query_range(tips, start, end, font))
+
+        for rows in fetch_batches(cursor, batch_rows, metrics=metrics):
+            yield from rows
+
+    logger.info(f"Leitura concluída: {metrics}")
+
+
+class ConnectionPool:
+    """
+    Up to ``size`` connections opened on demand and reused between queries.
+    A connection whose query raised is closed and replaced by a new one.
+    """
+
+    def __init__(self, connection_string: str, size: int = 4) -> None:
+        self.connection_string = connection_string
+        self.size = size
+        self.idle: Queue = Queue()
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    def __acquire(self) -> pyodbc.Connection:
+        while True:
+            try:
+                return self.idle.get_nowait()
+            except Empty:
+                pass
+
+            with self.lock:
+                new = self.opened < self.size
+                self.opened += new
+
+            if new:
+                try:
+                    return open_connection(self.connection_string)
+                except Exception:
+                    self.__release()
+                    raise
+
+            # wait for an idle connection or for a discarded one to be replaced
+            try:
+                return self.idle.get(timeout=0.5)
+            except Empty:
+                continue
+
+    def __release(self) -> None:
+        with self.lock:
+            self.opened -= 1
+
+    def __discard(self, con: pyodbc.Connection) -> None:
+        self.__release()
+
+        try:
+            con.close()
+        except pyodbc.Error as e:
+            logger.warning(f"Erro ao fechar a conexão: {e}")
+
+    @contextmanager
+    def cursor(self):
+        con = self.__acquire()
+
+        try:
+            cursor = con.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+            con.commit()
+        except Exception:
+            self.__discard(con)
+            raise
+
+        self.idle.put(con)
+
+    def close(self) -> None:
+        while not self.idle.empty():
+            self.idle.get_nowait().close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def split_window(
+    start: datetime, end: datetime, by: Literal["day", "hour"] = "day"
+) -> list[tuple[datetime, datetime]]:
+    """
+    Split the days from ``start`` to ``end`` (inclusive, as in ``iter_notes``)
+    into half-open ``[start, end)`` sub-ranges of one day or one hour.
+    """
+    step = timedelta(hours=1) if by == "hour" else timedelta(days=1)
+    lower = datetime(start.year, start.month, start.day)
+    upper = datetime(end.year, end.month, end.day) + timedelta(days=1)
+
+    ranges = []
+    while lower < upper:
+        ranges.append((lower, min(lower + step, upper)))
+        lower += step
+
+    return ranges
+
+
+def iter_notes_sharded(
+    server,
+    database,
+    *,
+    tips: list[str],
+    start: datetime,
+    end: datetime,
+    font: str = "dbnfe",
+    by: Literal["day", "hour"] = "day",
+    split_tips: bool = False,
+    workers: int = 4,
+    batch_rows: int = 1_000,
+) -> Generator[pyodbc.Row, Any, None]:
+    """
+    Extract the window in sub-ranges running concurrently on a pool of
+    ``workers`` connections, merged into one stream.
+
+    Rows come in shard order (sub-range, then ``controle1`` when
+    ``split_tips``) and ordered by ``dthGravacao`` inside each shard, so the
+    output is the same on every run. At most ``workers * 2`` shards are
+    queried ahead of the one being consumed, each streaming its batches
+    through a queue of ``SHARD_BATCHES`` batches.
+    Args:
+        by (Literal["day", "hour"], optional): Size of the sub-ranges.
+        split_tips (bool, optional): One shard per ``controle1`` too.
+        workers (int, optional): Concurrent connections. Defaults to 4.
+        batch_rows (int, optional): Rows per ``fetchmany`` round trip.
+    """
+    groups = [[tip] for tip in tips] if split_tips else [tips]
+    shards = [
+        (lower, upper, group)
+        for lower, upper in split_window(start, end, by)
+        for group in groups
+    ]
+
+    logger.info(f"Extraindo {len(shards)} partes com {workers} conexões")
+
+    stop = threading.Event()
+
+    def put(queue: Queue, item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.5)
+                return True
+            except Full:
+                continue
+
+        return False
+
+    def fetch(pool: ConnectionPool, queue: Queue, lower, upper, group) -> None:
+        try:
+            with pool.cursor() as cursor:
+                cursor.execute(query_range(group, lower, upper, font))
+
+                for rows in fetch_batches(cursor, batch_rows, metrics=metrics):
+                    if not put(queue, rows):
+                        break
+        finally:
+            put(queue, SHARD_DONE)
+
+    def submit(shard: tuple) -> tuple:
+        queue = Queue(maxsize=SHARD_BATCHES)
+        return queue, executor.submit(fetch, pool, queue, *shard)
+
+    metrics = FetchMetrics()
+    pending = deque()
+    shards = iter(shards)
+
+    with (
+        ConnectionPool(driver(server, database), workers) as pool,
+        ThreadPoolExecutor(max_workers=workers) as executor,
+    ):
+        try:
+            for shard in islice(shards, workers * 2):
+                pending.append(submit(shard))
+
+            while pending:
+                queue, future = pending.popleft()
+
+                if shard := next(shards, None):
+                    pending.append(submit(shard))
+
+                while (rows := queue.get()) is not SHARD_DONE:
+                    yield from rows
+
+                future.result()
+        finally:
+            # releases the shards still running when the consumer stops early
+            stop.set()
+            for __, future in pending:
+                future.cancel()
 
-        for row in cursor:
-            yield row
+    logger.info(f"Extração em partes concluída: {metrics}")
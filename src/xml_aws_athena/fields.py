@@ -0,0 +1,194 @@
+import re
+import lxml.etree as ET
+import pyarrow as pa
+from datetime import datetime
+from dateutil.parser import parse
+from functools import cache, lru_cache
+from typing import Any, Callable, NamedTuple
+from xml_aws_athena.schema import schema_nota
+
+
+class Field(NamedTuple):
+    """
+    Column of ``schema_nota`` and where it is read from the NF-e.
+
+    ``path`` is an XPath relative to the ``NFe`` element for header fields
+    and the tag name for item fields. Without ``convert`` the converter is
+    picked from the column type.
+    """
+
+    column: str
+    path: str
+    convert: Callable[[str], Any] | None = None
+
+
+@lru_cache(maxsize=4096)
+def to_datetime(txt: str) -> datetime:
+    """
+    ISO dates of the NF-e through ``datetime.fromisoformat``, with
+    ``dateutil`` as fallback for anything else. Cached, notes of a batch
+    repeat the same few dates.
+    """
+    try:
+        return datetime.fromisoformat(txt)
+    except ValueError:
+        return parse(txt)
+
+
+def to_date(txt: str) -> datetime:
+    return to_datetime(txt[:10])
+
+
+def to_code(txt: str) -> int:
+    return int(txt.replace("-", ""))
+
+
+def to_quantity(txt: str) -> int:
+    return int(float(txt))
+
+
+def to_key(txt: str) -> str:
+    return txt[3:].strip()
+
+
+def converter(column: str, schema: pa.Schema = schema_nota) -> Callable[[str], Any]:
+    """
+    Default converter of a column, by its type in ``schema``.
+    """
+    dtype = schema.field(column).type
+
+    if pa.types.is_integer(dtype):
+        return int
+
+    if pa.types.is_floating(dtype):
+        return float
+
+    if pa.types.is_timestamp(dtype):
+        return to_datetime
+
+    return str
+
+
+HEADER_FIELDS = (
+    Field("chave", "infNFe/@Id", to_key),
+    Field("dh_emi", "infNFe/ide/dhEmi", to_date),
+    Field("cnpj_origem", "infNFe/emit/CNPJ"),
+    Field("cnpj_destino", "infNFe/dest/CNPJ"),
+    Field("natureza_operacao", "infNFe/ide/natOp"),
+    Field("numero_nota", "infNFe/ide/nNF"),
+    Field("valor_nota", "infNFe/total//vNF"),
+    Field("valor_prod", "infNFe/total//vProd"),
+    Field("valor_desc", "infNFe/total//vDesc"),
+    Field("valor_base_calculo", "infNFe/total//vBC"),
+    Field("valor_icms", "infNFe/total//vICMS"),
+    Field("valor_ipi", "infNFe/total//vIPI"),
+    Field("valor_pis", "infNFe/total//vPIS"),
+    Field("valor_cofins", "infNFe/total//vCOFINS"),
+    Field("serie", "infNFe/ide/serie"),
+    Field("ref_chave", "infNFe/ide//refNFe"),
+)
+
+ITEM_FIELDS = (
+    Field("cod", "cProd", to_code),
+    Field("cod_barra", "cEAN"),
+    Field("nome_prod", "xProd"),
+    Field("ncm", "NCM"),
+    Field("cfop", "CFOP"),
+    Field("und_comercial", "uCom"),
+    Field("qtd", "qCom", to_quantity),
+    Field("vl_unit", "vUnCom"),
+    Field("vl_desc", "vDesc"),
+    Field("vl_prod", "vProd"),
+    Field("vl_base", "vBC", float),
+    Field("perc_icms", "pICMS"),
+    Field("vl_icms", "vICMS"),
+    Field("perc_ipi", "pIPI"),
+    Field("vl_ipi", "vIPI"),
+    Field("perc_pis", "pPIS"),
+    Field("vl_pis", "vPIS"),
+    Field("perc_cofins", "pCOFINS"),
+    Field("vl_cofins", "vCOFINS"),
+    Field("orig", "orig"),
+    Field("lote", "nLote"),
+    Field("qtd_lote", "qLote", to_quantity),
+    Field("dt_fab", "dFab"),
+    Field("dt_val", "dVal"),
+)
+
+# groups whose ``vBC`` becomes ``vl_base_<group>``
+TAX_GROUPS = ("ICMS", "IPI", "PIS", "COFINS")
+
+# header field only kept for ``estorno`` notes
+REF_COLUMN = "ref_chave"
+
+
+def ns_expr(expr: str) -> str:
+    """Qualify every element step of ``expr`` with the ``n`` prefix."""
+    return re.sub(r"(?<![@:\w])([A-Za-z_]\w*)", r"n:\1", expr)
+
+
+@cache
+def compile_header(namespace: str = "") -> tuple[tuple[str, ET.XPath, Callable], ...]:
+    """
+    Compiled ``(column, xpath, convert)`` of the header fields.
+    Args:
+        namespace (str, optional): NF-e namespace in Clark notation, empty
+            for trees whose tags had the namespace stripped. Defaults to "".
+    Returns:
+        tuple: One entry per field of ``HEADER_FIELDS``.
+    """
+    uri = namespace.strip("{}")
+    namespaces = {"n": uri} if uri else None
+
+    return tuple(
+        (
+            field.column,
+            ET.XPath(ns_expr(field.path) if uri else field.path, namespaces=namespaces),
+            field.convert or converter(field.column),
+        )
+        for field in HEADER_FIELDS
+    )
+
+
+@cache
+def compile_items(
+    namespace: str = "",
+) -> tuple[dict[str, tuple[str, Callable]], dict[str, str]]:
+    """
+    Item fields keyed by their qualified tag and the tax groups of ``vBC``.
+    Args:
+        namespace (str, optional): NF-e namespace in Clark notation, empty
+            for trees whose tags had the namespace stripped. Defaults to "".
+    Returns:
+        tuple: ``{tag: (column, convert)}`` and ``{group tag: suffix}``.
+    """
+    fields = {
+        f"{namespace}{field.path}": (
+            field.column,
+            field.convert or converter(field.column),
+        )
+        for field in ITEM_FIELDS
+    }
+    groups = {f"{namespace}{tag}": tag.lower() for tag in TAX_GROUPS}
+
+    return fields, groups
+
+
+def columns() -> list[str]:
+    """
+    Columns filled by the spec, ``vl_base`` expanded by tax group.
+    """
+    items = []
+    for field in ITEM_FIELDS:
+        if field.path == "vBC":
+            items.extend(f"{field.column}_{tag.lower()}" for tag in TAX_GROUPS)
+        else:
+            items.append(field.column)
+
+    return [
+        "controle",
+        "status",
+        *(field.column for field in HEADER_FIELDS),
+        "item",
+        *items,
+    ]
@@ -1,53 +1,323 @@
 from athena_mvsh import Athena, CursorParquetDuckdb
 import pyarrow as pa
+import pyarrow.parquet as pq
+import os
+from tempfile import TemporaryDirectory
+from uuid import uuid4
+from concurrent.futures import ThreadPoolExecutor
 from xml_aws_athena import config
+from xml_aws_athena.maintenance import BOOKMARK, maintain_gold
+from xml_aws_athena.state import StateStore
+from deltalake.exceptions import DeltaError
+import xml_aws_athena.write as Write
+import duckdb
 import logging
 
 logger = logging.getLogger(__name__)
 
+# rows per Parquet file staged for Athena
+ROWS_PER_FILE = int(config.get("gold_rows_per_file", 1_000_000))
 
-def comand_gold(data: pa.Table) -> None:
+# partitions of the Iceberg table, merged in parallel
+PARTITIONS = ["year", "month"]
+MERGE_WORKERS = int(config.get("gold_merge_workers", 4))
+
+# Athena errors of a concurrent Iceberg commit, and of throttling
+CONFLICT_MESSAGES = ("iceberg_commit_error", "concurrentmodification")
+TRANSIENT_MESSAGES = ("throttl", "toomanyrequests", "slow down", "internal_error")
+
+
+def classify_error(error: Exception) -> Write.Failure:
+    """
+    Classify a failed MERGE into the Iceberg table: a concurrent commit of
+    another partition was not applied and can be retried, Athena throttling
+    is transient, anything else is fatal.
+    """
+    message = str(error).lower()
+
+    if any(m in message for m in CONFLICT_MESSAGES):
+        return "conflict"
+
+    if any(m in message for m in TRANSIENT_MESSAGES):
+        return "transient"
+
+    return "fatal"
+
+
+def stage_parquet(
+    data: pa.Table | pa.RecordBatchReader,
+    tmpdirname: str,
+    rows_per_file: int = ROWS_PER_FILE,
+) -> tuple[dict[tuple, list[str]], int]:
+    """
+    Write the rows to local Parquet files per ``year``/``month`` partition,
+    one batch at a time.
+    Args:
+        data (pa.Table | pa.RecordBatchReader): Rows to stage.
+        tmpdirname (str): Directory of the files.
+        rows_per_file (int, optional): Rows per file. Defaults to ROWS_PER_FILE.
+    Returns:
+        tuple[dict[tuple, list[str]], int]: Paths of the files of each
+            ``(year, month)`` and total rows.
+    """
+    reader = data.to_reader() if isinstance(data, pa.Table) else data
+    files: dict[tuple, list[str]] = {}
+    writers: dict[tuple, pq.ParquetWriter] = {}
+    rows: dict[tuple, int] = {}
+    total = 0
+    os.makedirs(tmpdirname, exist_ok=True)
+
+    try:
+        for batch in reader:
+            chunk = pa.Table.from_batches([batch]).sort_by(
+                [(name, "ascending") for name in PARTITIONS]
+            )
+            groups = chunk.group_by(PARTITIONS, use_threads=False).aggregate(
+                [([], "count_all")]
+            )
+
+            offset = 0
+            for group in groups.to_pylist():
+                key, count = (
+                    tuple(group[name] for name in PARTITIONS),
+                    group["count_all"],
+                )
+
+                if key not in writers or rows[key] >= rows_per_file:
+                    if key in writers:
+                        writers[key].close()
+
+                    paths = files.setdefault(key, [])
+                    name = f"{'_'.join(map(str, key))}_{len(paths):04d}"
+                    paths.append(f"{tmpdirname}/{name}.parquet")
+                    writers[key] = pq.ParquetWriter(
+                        paths[-1], reader.schema, compression="zstd"
+                    )
+                    rows[key] = 0
+
+                writers[key].write_table(chunk.slice(offset, count))
+                rows[key] += count
+                offset += count
+
+            total += batch.num_rows
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    return files, total
+
+
+def partition_bounds(partition: tuple, alias: str = "t") -> str:
+    """
+    Predicate of one ``(year, month)`` partition.
+    """
+    return " and ".join(
+        f"{alias}.{name} is null" if value is None else f"{alias}.{name} = {value}"
+        for name, value in zip(PARTITIONS, partition)
+    )
+
+
+def merge_partition(
+    schema: str,
+    table_name: str,
+    partition: tuple,
+    files: list[str],
+) -> None:
+    """
+    Merge the rows of one partition, through its own staging table, so
+    partitions can be merged in parallel and each MERGE only scans its
+    partition of the target. The staging table name ends with a suffix of
+    its own, so concurrent runs never share one.
+    """
+    stage = f"stage_{table_name}_{'_'.join(map(str, partition))}_{uuid4().hex[:8]}"
+    cols = [f'"{name}"' for name in pq.read_schema(files[0]).names]
+    values = ", ".join(f"s.{col}" for col in cols)
+
+    stmt = f"""
+        MERGE INTO "{schema}"."{table_name}" AS t
+        USING "{schema}"."{stage}" AS s
+        ON (t.chave = s.chave and t.item = s.item and {partition_bounds(partition)})
+        WHEN MATCHED
+            THEN UPDATE SET {", ".join(f"{col} = s.{col}" for col in cols)}
+        WHEN NOT MATCHED
+            THEN INSERT ({", ".join(cols)}) VALUES ({values})
+    """
+
+    with Athena(cursor=athena_cursor()) as cliente:
+        cliente.write_table_iceberg(
+            files,
+            table_name=stage,
+            schema=schema,
+            location=f"{config.get('location_table')}_stage/{stage}/",
+        )
+
+        try:
+            Write.commit_with_retry(
+                lambda: cliente.execute(stmt),
+                f"merge {stage}",
+                idempotent=True,
+                classify=classify_error,
+            )
+        finally:
+            cliente.execute(f"DROP TABLE IF EXISTS `{schema}`.`{stage}`")
+
+    logger.info(f"Partição {partition} atualizada")
+
+
+def is_partitioned(cliente: Athena, schema: str, table_name: str) -> bool:
+    """
+    Whether the Iceberg table has partitions, read from its ``$partitions``
+    metadata table, which only has a ``partition`` column when it does.
+    """
+    try:
+        cliente.execute(
+            f'select partition from "{schema}"."{table_name}$partitions" limit 1'
+        )
+    except Exception as e:
+        if "column_not_found" in str(e).lower():
+            return False
+        raise
+
+    return True
+
+
+def athena_cursor() -> CursorParquetDuckdb:
+    return CursorParquetDuckdb(config.get("s3_staging_dir"), result_reuse_enable=True)
+
+
+def comand_gold(data: pa.Table | pa.RecordBatchReader) -> None:
     """
     Write the final table to Athena.
     Args:
-        data (pa.Table): Data to write.
+        data (pa.Table | pa.RecordBatchReader): Data to write, staged to local
+            Parquet files a batch at a time.
+    """
+    with TemporaryDirectory() as tmpdirname:
+        files, rows = stage_parquet(data, tmpdirname)
+
+        if rows == 0:
+            raise ValueError("Tabela vazia, não é possível escrever no Athena")
+
+        write_gold(files, rows)
+
+
+def comand_gold_incremental(state: StateStore = None, full_reload: bool = False) -> int:
+    """
+    Write to Athena only the silver rows inserted or updated since the last
+    load, read from the Delta change data feed. The first load reads the
+    whole table.
+
+    Versions no longer in the feed raise an error instead of silently
+    reloading the whole table, ``maintain_silver`` keeps them while the
+    bookmark points at them.
+    Args:
+        state (StateStore, optional): Store of the bookmark. Defaults to None.
+        full_reload (bool, optional): Read the whole table when the changes
+            are unavailable. Defaults to False.
+    Returns:
+        int: Rows written.
     """
+    state = state or StateStore()
+    version = Write.table_version()
+    last = state.get_value(BOOKMARK)
+
+    if last is not None and int(last) >= version:
+        logger.info(f"Nenhuma alteração na silver desde a versão {last}")
+        return 0
+
+    with TemporaryDirectory() as tmpdirname:
+        files = None
 
-    rows, __ = data.shape
-    if rows == 0:
-        raise ValueError("Tabela vazia, não é possível escrever no Athena")
+        if last is not None:
+            first = int(last) + 1
+            logger.info(f"Lendo alterações da silver entre {first} e {version}")
 
-    cursor = CursorParquetDuckdb(config.get("s3_staging_dir"), result_reuse_enable=True)
+            try:
+                files, rows = stage_parquet(
+                    Write.read_changes(first, version), f"{tmpdirname}/cdf"
+                )
+            except (DeltaError, OSError, duckdb.Error) as e:
+                if not full_reload:
+                    logger.error(f"Alterações indisponíveis: {e}")
+                    raise RuntimeError(
+                        f"Alterações da silver entre as versões {first} e "
+                        f"{version} indisponíveis, use full_reload=True para "
+                        "recarregar a tabela inteira"
+                    ) from e
 
+                logger.warning(f"Alterações indisponíveis, carga completa: {e}")
+
+        if files is None:
+            logger.info(f"Carga completa da silver na versão {version}")
+            files, rows = stage_parquet(Write.read_snapshot(), tmpdirname)
+
+        if rows:
+            write_gold(files, rows)
+
+    state.set_value(BOOKMARK, str(version))
+
+    return rows
+
+
+def write_gold(files: dict[tuple, list[str]], rows: int) -> None:
+    """
+    Create the Iceberg table partitioned by ``year``/``month``, or merge the
+    staged partitions into it on up to ``MERGE_WORKERS`` parallel queries.
+
+    A table created before the partitions is recreated partitioned from the
+    silver snapshot, which already holds the staged rows: Athena cannot
+    change the partitioning of an existing Iceberg table.
+    """
     table_name = "notas_xml"
     schema = "prevencao-perdas"
 
     location = f"{config.get('location_table')}{table_name}/"
 
     logger.info(f"Escrevendo tabela {table_name} no Athena...")
-    logger.info(f"Total de registros {data.shape}")
+    logger.info(f"Total de registros {rows} em {len(files)} partições")
 
-    with Athena(cursor=cursor) as cliente:
+    with Athena(cursor=athena_cursor()) as cliente:
         is_table = cliente.execute(f"""
             select 1 as ok from information_schema.tables
             where table_schema = '{schema}'
             and table_name = '{table_name}' limit 1
         """)
 
-        if is_table.fetchone():
+        exists = is_table.fetchone() is not None
+
+        if exists and not is_partitioned(cliente, schema, table_name):
+            logger.warning(f"Tabela {table_name} sem partições, recriando...")
+
+            with TemporaryDirectory() as tmpdirname:
+                snapshot, total = stage_parquet(Write.read_snapshot(), tmpdirname)
+                logger.info(f"Total de registros {total} da silver")
+
+                cliente.write_table_iceberg(
+                    [path for paths in snapshot.values() for path in paths],
+                    table_name=table_name,
+                    schema=schema,
+                    location=location,
+                    partitions=PARTITIONS,
+                    if_exists="replace",
+                )
+        elif exists:
             logger.info(f"Tabela {table_name} já existe, atualizando...")
-            cliente.merge_table_iceberg(
-                table_name,
-                data,
-                schema=schema,
-                predicate="t.chave = s.chave and t.item = s.item",
-                location=location,
-            )
+
+            with ThreadPoolExecutor(max_workers=MERGE_WORKERS) as executor:
+                futures = [
+                    executor.submit(merge_partition, schema, table_name, key, paths)
+                    for key, paths in files.items()
+                ]
+                for future in futures:
+                    future.result()
         else:
             logger.info(f"Criando tabela {table_name}...")
             cliente.write_table_iceberg(
-                data, table_name=table_name, schema=schema, location=location
+                [path for paths in files.values() for path in paths],
+                table_name=table_name,
+                schema=schema,
+                location=location,
+                partitions=PARTITIONS,
             )
 
-        cliente.execute(f"OPTIMIZE {schema}.{table_name} REWRITE DATA USING BIN_PACK")
-        cliente.execute(f"VACUUM {schema}.{table_name}")
+        maintain_gold(cliente, schema, table_name)
@@ -0,0 +1,207 @@
+import logging
+from typing import Iterable
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import xml_aws_athena.write as Write
+from xml_aws_athena.schema import partition_by
+
+logger = logging.getLogger(__name__)
+
+# file of the index directory with the table version the shards reflect
+VERSION_FILE = "_version"
+
+# partition value of the rows without one, as in Hive partitions
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+def key_column(data: pa.Table) -> pa.Array:
+    """
+    ``chave/item`` keys of the rows of ``data``.
+    """
+    item = pc.cast(data["item"], pa.string()).fill_null("")
+
+    return pc.binary_join_element_wise(data["chave"], item, "/").combine_chunks()
+
+
+def shard_column(data: pa.Table) -> pa.Array:
+    """
+    ``controle=<controle>/year=<year>/month=<month>`` shard of the rows of
+    ``data``, the silver partition they are written to.
+    """
+    data = Write.with_partitions(data)
+    parts = [
+        pc.binary_join_element_wise(
+            f"{name}=",
+            pc.cast(data[name], pa.string()).fill_null(NULL_PARTITION),
+            "",
+        )
+        for name in partition_by
+    ]
+
+    return pc.binary_join_element_wise(*parts, "/").combine_chunks()
+
+
+class KeyIndex:
+    """
+    Sorted files with the ``(chave, item)`` keys of the silver Delta table,
+    one per partition, and the table version they reflect.
+
+    It splits a batch into rows that are certainly new, appended, and rows
+    that may already exist, merged. Only the shards of the partitions a batch
+    touches are loaded and rewritten, so its cost does not grow with the
+    table. The index is rebuilt from the table when its version does not
+    match the last commit that changed the rows, e.g. after a write from
+    another process. Maintenance commits, such as compactions and vacuums,
+    do not change the keys and are skipped.
+    """
+
+    def __init__(self, path: str = None) -> None:
+        self.path = (path or Write.keys_path).rstrip("/")
+        self.shards: dict[str, pa.Array] = {}
+        self.version: int = None
+
+    def __len__(self) -> int:
+        """Keys of the loaded shards."""
+        return sum(len(keys) for keys in self.shards.values())
+
+    def __file(self, shard: str) -> str:
+        return f"{self.path}/{shard}.parquet"
+
+    def __read_version(self) -> int | None:
+        fs, path = Write.filesystem(f"{self.path}/{VERSION_FILE}")
+
+        try:
+            with fs.open_input_stream(path) as f:
+                return int(f.read())
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+
+    def __load(self, shard: str) -> pa.Array:
+        fs, path = Write.filesystem(self.__file(shard))
+
+        try:
+            with fs.open_input_file(path) as f:
+                return pq.read_table(f)["key"].combine_chunks()
+        except (FileNotFoundError, OSError):
+            return pa.array([], pa.string())
+
+    def __touch(self, shards: list[str]) -> None:
+        """Load the ``shards`` missing from memory."""
+        for shard in shards:
+            if shard not in self.shards:
+                self.shards[shard] = self.__load(shard)
+
+    def sync(self) -> None:
+        """
+        Match the index to the last version that changed the rows of the
+        table, rebuilding it when the stored shards are behind.
+        """
+        version = Write.data_version()
+        if version == self.version:
+            return
+
+        # another writer of the same index may have rewritten the shards
+        self.shards = {}
+
+        if self.__read_version() == version:
+            self.version = version
+            return
+
+        logger.info(f"Reconstruindo índice de chaves da versão {version}")
+        data = Write.read_keys()
+        self.__clear()
+        self.version = version
+        self.save(self.__group(data))
+        self.shards = {}
+
+    def __group(self, data: pa.Table) -> dict[str, pa.Array]:
+        """Unique keys of ``data`` per shard."""
+        keys, shards = key_column(data), shard_column(data)
+
+        return {
+            shard: pc.unique(keys.filter(pc.equal(shards, shard)))
+            for shard in pc.unique(shards).to_pylist()
+        }
+
+    def exists(self, data: pa.Table | pa.RecordBatch) -> pa.Array:
+        """
+        Mask of the rows of ``data`` whose key may already exist, looked up
+        in the shards of its partitions only. Call ``sync`` first.
+        """
+        if isinstance(data, pa.RecordBatch):
+            data = pa.Table.from_batches([data])
+
+        shards = pc.unique(shard_column(data)).to_pylist()
+        self.__touch(shards)
+
+        value_set = pa.chunked_array([self.shards[s] for s in shards], pa.string())
+        return pc.is_in(key_column(data), value_set=value_set.combine_chunks())
+
+    def split(self, data: pa.Table) -> tuple[pa.Table, pa.Table]:
+        """
+        Split ``data`` into new rows and rows whose key may already exist.
+        """
+        self.sync()
+        exists = self.exists(data)
+
+        return data.filter(pc.invert(exists)), data.filter(exists)
+
+    def add(self, data: pa.Table | Iterable[pa.RecordBatch], version: int) -> None:
+        """
+        Add the keys of ``data``, written by the commits up to ``version``,
+        and keep only their shards in memory. An invalidated index starts
+        over from ``data`` alone, the rows of a table just created.
+        """
+        if self.version is None:
+            self.__clear()
+            self.shards = {}
+
+        groups: dict[str, list[pa.Array]] = {}
+        for batch in [data] if isinstance(data, pa.Table) else data:
+            if isinstance(batch, pa.RecordBatch):
+                batch = pa.Table.from_batches([batch])
+
+            for shard, keys in self.__group(batch).items():
+                groups.setdefault(shard, []).append(keys)
+
+        self.__touch(list(groups))
+        self.shards = {shard: self.shards[shard] for shard in groups}
+
+        self.version = version
+        self.save(
+            {
+                shard: pc.unique(pa.chunked_array([self.shards[shard], *keys]))
+                for shard, keys in groups.items()
+            }
+        )
+
+    def invalidate(self) -> None:
+        self.shards, self.version = {}, None
+
+    def __clear(self) -> None:
+        fs, path = Write.filesystem(self.path)
+        fs.delete_dir_contents(path, missing_dir_ok=True)
+
+    def save(self, shards: dict[str, pa.Array]) -> None:
+        """
+        Write the ``shards``, then the version of the index, so a writer that
+        stops in between leaves a stale version and a rebuild, not wrong keys.
+        """
+        for shard, keys in shards.items():
+            keys = keys.take(pc.sort_indices(keys))
+            table = pa.table({"key": keys})
+
+            fs, path = Write.filesystem(self.__file(shard))
+            fs.create_dir(path.rsplit("/", 1)[0], recursive=True)
+
+            with fs.open_output_stream(path) as f:
+                pq.write_table(table, f, compression="zstd")
+
+            self.shards[shard] = keys
+
+        fs, path = Write.filesystem(f"{self.path}/{VERSION_FILE}")
+        fs.create_dir(path.rsplit("/", 1)[0], recursive=True)
+
+        with fs.open_output_stream(path) as f:
+            f.write(str(self.version).encode())
@@ -0,0 +1,264 @@
+import json
+import logging
+import math
+import pyarrow as pa
+import pyarrow.compute as pc
+import xml_aws_athena.write as Write
+from datetime import datetime, timedelta
+from deltalake import DeltaTable
+from athena_mvsh import Athena
+from xml_aws_athena import config
+from xml_aws_athena.state import StateStore
+
+logger = logging.getLogger(__name__)
+
+# thresholds that trigger each operation
+SMALL_FILE_BYTES = int(config.get("maintenance_small_file_bytes", 32 * 2**20))
+SMALL_FILES = int(config.get("maintenance_small_files", 50))
+CHECKPOINT_VERSIONS = int(config.get("maintenance_checkpoint_versions", 100))
+VACUUM_BYTES = int(config.get("maintenance_vacuum_bytes", 2**30))
+SNAPSHOTS = int(config.get("maintenance_snapshots", 50))
+
+# every operation still runs at least once per cadence
+CADENCE = timedelta(hours=float(config.get("maintenance_cadence_hours", 24)))
+VACUUM_RETENTION_HOURS = Write.VACUUM_RETENTION_HOURS
+
+# last silver version loaded into gold, read back from the change data feed
+BOOKMARK = "gold:notas_xml:silver_version"
+
+
+class Schedule:
+    """
+    Last run of each maintenance operation of a table, kept in the state store.
+    """
+
+    def __init__(
+        self, table: str, state: StateStore = None, cadence: timedelta = CADENCE
+    ) -> None:
+        self.table = table
+        self.state = state or StateStore()
+        self.cadence = cadence
+
+    def __name(self, operation: str) -> str:
+        return f"maintenance:{self.table}:{operation}"
+
+    def overdue(self, operation: str) -> bool:
+        last = self.state.get_watermark(self.__name(operation))
+        return last is None or datetime.now() - last >= self.cadence
+
+    def done(self, operation: str) -> None:
+        self.state.set_watermark(self.__name(operation), datetime.now())
+
+
+def vacuum_retention(state: StateStore) -> int:
+    """
+    Vacuum retention of the silver table, extended so the change data feed
+    after the gold bookmark is not removed before ``comand_gold_incremental``
+    reads it.
+    """
+    retention = VACUUM_RETENTION_HOURS
+
+    if (last := state.get_value(BOOKMARK)) is None:
+        return retention
+
+    if (committed := Write.version_timestamp(int(last))) is None:
+        return retention
+
+    hours = math.ceil((datetime.now() - committed).total_seconds() / 3600)
+    if hours > retention:
+        logger.info(f"Vacuum retido em {hours}h pela carga da gold (versão {last})")
+
+    return max(retention, hours)
+
+
+def mergeable_small_files(actions: pa.RecordBatch) -> int:
+    """
+    Small files that a compaction can merge, those sharing their partition
+    with another small file. A compacted partition keeps one small file,
+    which is not counted.
+    Args:
+        actions (pa.RecordBatch): Flattened add actions of the Delta table.
+    Returns:
+        int: Number of mergeable small files.
+    """
+    actions = pa.Table.from_batches([actions])
+    small = actions.filter(pc.less(actions["size_bytes"], SMALL_FILE_BYTES))
+    keys = [name for name in actions.column_names if name.startswith("partition.")]
+    if not keys:
+        return small.num_rows if small.num_rows > 1 else 0
+
+    counts = small.group_by(keys).aggregate([("size_bytes", "count")])
+    counts = counts["size_bytes_count"]
+    return pc.sum(pc.filter(counts, pc.greater(counts, 1))).as_py() or 0
+
+
+def delta_stats(
+    check_vacuum: bool = True, retention: int = VACUUM_RETENTION_HOURS
+) -> dict:
+    """
+    Statistics of the silver Delta table used by ``maintain_silver``.
+    Args:
+        check_vacuum (bool, optional): Measure the bytes a vacuum would remove,
+            which lists the whole table. Defaults to True.
+        retention (int, optional): Retention hours of the vacuum. Defaults
+            to VACUUM_RETENTION_HOURS.
+    Returns:
+        dict: ``files``, ``small_files`` (mergeable, see
+            ``mergeable_small_files``), ``versions_since_checkpoint`` and
+            ``vacuum_bytes`` (None when not checked).
+    """
+    dt = DeltaTable(Write.table_path, storage_options=Write.storage_options)
+    actions = dt.get_add_actions(flatten=True)
+
+    fs, path = Write.filesystem(f"{Write.table_path.rstrip('/')}/_delta_log")
+    try:
+        with fs.open_input_stream(f"{path}/_last_checkpoint") as f:
+            checkpoint = json.loads(f.read())["version"]
+    except (FileNotFoundError, OSError):
+        checkpoint = -1
+
+    vacuum_bytes = None
+    if check_vacuum:
+        removable = dt.vacuum(
+            retention_hours=retention,
+            enforce_retention_duration=False,
+            dry_run=True,
+        )
+        fs, path = Write.filesystem(Write.table_path.rstrip("/"))
+        infos = fs.get_file_info([f"{path}/{file}" for file in removable])
+        vacuum_bytes = sum(info.size or 0 for info in infos)
+
+    return {
+        "files": actions.num_rows,
+        "small_files": mergeable_small_files(actions),
+        "versions_since_checkpoint": dt.version() - checkpoint,
+        "vacuum_bytes": vacuum_bytes,
+    }
+
+
+def maintain_silver(
+    changed: bool = True, state: StateStore = None, force: bool = False
+) -> list[str]:
+    """
+    Run the maintenance of the silver Delta table whose threshold was
+    crossed or whose cadence is overdue, instead of all of it on every run.
+    Args:
+        changed (bool, optional): Rows were updated since the last run, so
+            there may be files to vacuum. Defaults to True.
+        state (StateStore, optional): Store of the last runs. Defaults to None.
+        force (bool, optional): Run every operation. Defaults to False.
+    Returns:
+        list[str]: Operations executed.
+    """
+    state = state or StateStore()
+    schedule = Schedule("silver", state)
+    retention = vacuum_retention(state)
+    check_vacuum = force or changed or schedule.overdue("vacuum")
+    stats = delta_stats(check_vacuum, retention)
+    logger.info(f"Estatísticas da tabela Delta Lake: {stats}")
+
+    executed = []
+
+    if force or stats["small_files"] >= SMALL_FILES or schedule.overdue("optimize"):
+        logger.info(f"Compactando {stats['small_files']} arquivos pequenos")
+        Write.commit_with_retry(
+            lambda: DeltaTable(
+                Write.table_path, storage_options=Write.storage_options
+            ).optimize.compact(writer_properties=Write.WRITER_PROPERTIES),
+            "optimize",
+            idempotent=True,
+        )
+        schedule.done("optimize")
+        executed.append("optimize")
+
+    dt = DeltaTable(Write.table_path, storage_options=Write.storage_options)
+
+    # the compaction leaves the replaced files to vacuum
+    if (
+        force
+        or "optimize" in executed
+        or (check_vacuum and stats["vacuum_bytes"] >= VACUUM_BYTES)
+        or schedule.overdue("vacuum")
+    ):
+        removed = dt.vacuum(
+            retention_hours=retention,
+            enforce_retention_duration=False,
+            dry_run=False,
+        )
+        logger.info(f"Vacuum removeu {len(removed)} arquivos")
+        schedule.done("vacuum")
+        executed.append("vacuum")
+
+    if (
+        force
+        or stats["versions_since_checkpoint"] >= CHECKPOINT_VERSIONS
+        or schedule.overdue("checkpoint")
+    ):
+        logger.info(f"Checkpoint após {stats['versions_since_checkpoint']} versões")
+        dt.update_incremental()
+        dt.create_checkpoint()
+        dt.cleanup_metadata()
+        schedule.done("checkpoint")
+        executed.append("checkpoint")
+
+    return executed
+
+
+def maintain_gold(
+    cliente: Athena,
+    schema: str,
+    table_name: str,
+    state: StateStore = None,
+    force: bool = False,
+) -> list[str]:
+    """
+    Run ``OPTIMIZE`` / ``VACUUM`` on an Iceberg table only when the small
+    files or snapshots cross their thresholds, or the cadence is overdue.
+    Args:
+        cliente (Athena): Open Athena client.
+        schema (str): Schema of the table.
+        table_name (str): Table name.
+        state (StateStore, optional): Store of the last runs. Defaults to None.
+        force (bool, optional): Run every operation. Defaults to False.
+    Returns:
+        list[str]: Operations executed.
+    """
+    schedule = Schedule(f"gold:{schema}.{table_name}", state)
+
+    # only the small files sharing their partition can be merged
+    files, small_files = cliente.execute(f"""
+        select coalesce(sum(files), 0), coalesce(sum(if(small > 1, small, 0)), 0)
+        from (
+            select count(*) as files,
+                count_if(file_size_in_bytes < {SMALL_FILE_BYTES}) as small
+            from "{schema}"."{table_name}$files"
+            group by partition
+        )
+    """).fetchone()
+    (snapshots,) = cliente.execute(f"""
+        select count(*) from "{schema}"."{table_name}$snapshots"
+    """).fetchone()
+
+    logger.info(
+        f"Tabela {table_name}: {files} arquivos, {small_files} pequenos, "
+        f"{snapshots} snapshots"
+    )
+
+    executed = []
+
+    if force or small_files >= SMALL_FILES or schedule.overdue("optimize"):
+        cliente.execute(f"OPTIMIZE {schema}.{table_name} REWRITE DATA USING BIN_PACK")
+        schedule.done("optimize")
+        executed.append("optimize")
+
+    if (
+        force
+        or "optimize" in executed
+        or snapshots >= SNAPSHOTS
+        or schedule.overdue("vacuum")
+    ):
+        cliente.execute(f"VACUUM {schema}.{table_name}")
+        schedule.done("vacuum")
+        executed.append("vacuum")
+
+    return executed
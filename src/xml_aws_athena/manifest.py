@@ -0,0 +1,132 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from xml_aws_athena.cloud import Storage
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "_manifest.json"
+
+
+def digest(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+class UploadManifest:
+    """
+    Content hash of every object uploaded to the raw layer, used to skip
+    uploads whose content did not change.
+
+    Digests are kept in one ``_manifest.json`` per folder (``raw/{controle}/
+    {yyyy/mm/dd}``), loaded on first use from ``local_dir`` or, when not
+    there, from the bucket. ``save`` writes the changed folders back to both.
+
+    Each folder is loaded under its own lock, so the uploads of other
+    folders are not held back while a manifest is being downloaded.
+    """
+
+    def __init__(
+        self, client: Storage = None, bucket: str = None, local_dir: str = None
+    ) -> None:
+        """
+        Args:
+            client (Storage, optional): Client used to keep the manifests in S3.
+            bucket (str, optional): Bucket of the manifests.
+            local_dir (str, optional): Local copy of the manifests.
+        """
+        self.client = client
+        self.bucket = bucket
+        self.local_dir = local_dir
+        self.folders: dict[str, dict[str, str]] = {}
+        self.locks: dict[str, threading.Lock] = {}
+        self.changed: set[str] = set()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __local_path(self, folder: str) -> str:
+        return os.path.join(self.local_dir, folder, MANIFEST_NAME)
+
+    def __load(self, folder: str) -> dict[str, str]:
+        if self.local_dir and os.path.exists(path := self.__local_path(folder)):
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+
+        if self.client and (
+            body := self.client.get_object_file(
+                self.bucket, f"{folder}/{MANIFEST_NAME}"
+            )
+        ):
+            return json.loads(body)
+
+        return {}
+
+    def __folder(self, key: str) -> tuple[str, dict[str, str]]:
+        folder = key.rpartition("/")[0]
+
+        with self.lock:
+            lock = self.locks.setdefault(folder, threading.Lock())
+
+        with lock:
+            if folder not in self.folders:
+                digests = self.__load(folder)
+
+                with self.lock:
+                    self.folders[folder] = digests
+
+        return folder, self.folders[folder]
+
+    def is_unchanged(self, key: str, body: bytes) -> bool:
+        """
+        True when ``key`` was uploaded before with the same content.
+        """
+        value = digest(body)
+        __, digests = self.__folder(key)
+
+        with self.lock:
+            if digests.get(key) == value:
+                self.hits += 1
+                return True
+
+            self.misses += 1
+            return False
+
+    def record(self, key: str, body: bytes) -> None:
+        """
+        Record the digest of an uploaded object.
+        """
+        value = digest(body)
+        folder, digests = self.__folder(key)
+
+        with self.lock:
+            digests[key] = value
+            self.changed.add(folder)
+
+    def save(self) -> None:
+        with self.lock:
+            bodies = {
+                folder: json.dumps(self.folders[folder], indent=0).encode("utf-8")
+                for folder in self.changed
+            }
+            self.changed.clear()
+
+        for folder, body in bodies.items():
+            if self.local_dir:
+                os.makedirs(
+                    os.path.dirname(path := self.__local_path(folder)),
+                    exist_ok=True,
+                )
+                with open(path, mode="wb") as f:
+                    f.write(body)
+
+            if self.client:
+                self.client.put_object_file(
+                    body, self.bucket, f"{folder}/{MANIFEST_NAME}"
+                )
+
+        logger.info(
+            f"Manifesto: {self.hits} sem alteração, {self.misses} enviados, "
+            f"{len(bodies)} pastas atualizadas"
+        )
@@ -0,0 +1,195 @@
+import json
+import logging
+from io import BytesIO
+from uuid import uuid4
+from datetime import datetime
+from typing import Any, Generator, Iterable
+from xml_aws_athena.cloud import Storage
+from xml_aws_athena.compression import Codec, SUFFIX, compress, decompress
+
+logger = logging.getLogger(__name__)
+
+PACK_NAME = "pack_{batch}.xml"
+INDEX_SUFFIX = ".idx.json"
+
+
+def index_key(pack_key: str) -> str:
+    return f"{pack_key.rsplit('.xml', 1)[0]}{INDEX_SUFFIX}"
+
+
+class PackWriter:
+    """
+    Packed raw container: many notes in one object, each note compressed as
+    an independent gzip member / zstd frame, plus a JSON index with the
+    offset and length of every note.
+
+    Concatenated frames decompress as a whole, and a single note can be
+    read with a ranged GET of its own bytes.
+    """
+
+    def __init__(self, codec: Codec = "zstd", level: int = 3) -> None:
+        self.codec = codec
+        self.level = level
+        self.buffer = BytesIO()
+        self.notes: list[dict] = []
+
+    def __len__(self) -> int:
+        return len(self.notes)
+
+    def add(
+        self,
+        string_xml: str,
+        chave: str,
+        instatus: int,
+        dtgravacao: datetime,
+        controle: str,
+    ) -> None:
+        frame = compress(string_xml.encode("utf-8"), self.codec, self.level)
+
+        self.notes.append(
+            {
+                "chave": chave,
+                "status": instatus,
+                "dtgravacao": dtgravacao.isoformat(),
+                "controle": controle,
+                "offset": self.buffer.tell(),
+                "length": len(frame),
+            }
+        )
+        self.buffer.write(frame)
+
+    def body(self) -> BytesIO:
+        self.buffer.seek(0)
+        return self.buffer
+
+    def index(self) -> bytes:
+        return json.dumps({"codec": self.codec, "notes": self.notes}).encode("utf-8")
+
+
+def upload_packs(
+    client: Storage,
+    bucket: str,
+    notas: Iterable[tuple],
+    sub_path: str = "raw",
+    codec: Codec = "zstd",
+    put_object: bool = True,
+) -> dict[str, list[tuple]]:
+    """
+    Upload the notes as one pack per ``{controle}/{yyyy/mm/dd}`` folder.
+    Args:
+        client (Storage): Storage client.
+        bucket (str): Bucket name.
+        notas (Iterable[tuple]): Tuples containing position and data.
+        sub_path (str, optional): Layer prefix. Defaults to "raw".
+        codec (Codec, optional): Compression of the notes. Defaults to "zstd".
+        put_object (bool, optional): Flag to upload the objects. Defaults to True.
+    Returns:
+        dict[str, list[tuple]]: Notes of each pack, by key. Packs whose body
+            or index failed to upload are left out.
+    """
+    packs: dict[str, PackWriter] = {}
+    notes: dict[str, list[tuple]] = {}
+
+    for pos, data in notas:
+        xml, chave, instatus, dtgravacao, controle = data
+        folder = f"{sub_path}/{controle}/{dtgravacao:%Y/%m/%d}"
+        pack = packs.setdefault(folder, PackWriter(codec))
+        pack.add(xml, chave, instatus, dtgravacao, controle)
+        notes.setdefault(folder, []).append((pos, data))
+
+    batch = f"{datetime.now():%Y%m%d%H%M%S}_{uuid4().hex[:8]}"
+    keys = {}
+
+    objects = []
+
+    for folder, pack in packs.items():
+        key = f"{folder}/{PACK_NAME.format(batch=batch)}{SUFFIX[codec]}"
+        objects += [(pack.body(), key), (pack.index(), index_key(key))]
+
+        logger.info(f"Pacote {key} com {len(pack)} notas, s3: {put_object}")
+        keys[key] = notes[folder]
+
+    if put_object:
+        result = client.put_objects(objects, bucket)
+
+        for key, body, index in zip([*keys], result[::2], result[1::2]):
+            if not (body and index):
+                logger.error(f"Pacote {key}, falha no upload")
+                del keys[key]
+
+    return keys
+
+
+class PackReader:
+    """
+    Read notes back from a pack, one at a time by ``chave``/status with a
+    ranged GET, or all of them streaming the object once.
+    """
+
+    def __init__(self, client: Storage, bucket: str, key: str) -> None:
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+
+        index = json.loads(client.get_object_file(bucket, index_key(key)))
+        self.codec: Codec = index["codec"]
+        self.notes: list[dict] = index["notes"]
+        self.by_key = {(note["chave"], note["status"]): note for note in self.notes}
+
+    def __len__(self) -> int:
+        return len(self.notes)
+
+    def __row(self, note: dict, frame: bytes) -> tuple:
+        return (
+            decompress(frame, self.codec).decode("utf-8"),
+            note["chave"],
+            note["status"],
+            datetime.fromisoformat(note["dtgravacao"]),
+            note["controle"],
+        )
+
+    def get(self, chave: str, instatus: int) -> tuple:
+        """
+        Fetch a single note with a ranged GET.
+        Returns:
+            tuple: ``(xml, chave, status, dtgravacao, controle)``, as ``iter_notes``.
+        """
+        note = self.by_key[(chave, instatus)]
+        start = note["offset"]
+        frame = self.client.get_object_file(
+            self.bucket, self.key, byte_range=(start, start + note["length"] - 1)
+        )
+
+        return self.__row(note, frame)
+
+    def __iter__(self) -> Generator[tuple, Any, None]:
+        stream = self.client.get_object_stream(self.bucket, self.key)
+        position = 0
+
+        try:
+            for note in sorted(self.notes, key=lambda note: note["offset"]):
+                if skip := note["offset"] - position:
+                    stream.read(skip)
+
+                yield self.__row(note, stream.read(note["length"]))
+                position = note["offset"] + note["length"]
+        finally:
+            stream.close()
+
+
+def iter_packed_notes(
+    client: Storage, bucket: str, prefix: str
+) -> Generator[tuple, Any, None]:
+    """
+    Stream every note of the packs under ``prefix`` (e.g. ``raw/TRANSF/2025/04``)
+    as ``(position, row)`` tuples, with ``iter_notes`` rows, the input of
+    ``command_silver`` once materialized: ``[*iter_packed_notes(...)]``.
+    """
+    keys = (
+        key
+        for key in client.list_objects(bucket, prefix)
+        if key.rsplit("/", 1)[-1].startswith("pack_") and not key.endswith(INDEX_SUFFIX)
+    )
+
+    rows = (row for key in keys for row in PackReader(client, bucket, key))
+    yield from enumerate(rows)
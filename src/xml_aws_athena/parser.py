@@ -1,5 +1,4 @@
 import lxml.etree as ET
-from dateutil.parser import parse
 from pathlib import Path
 from datetime import datetime
 from unicodedata import normalize, combining
@@ -9,6 +8,11 @@ import pyarrow as pa
 import pandas as pd
 from io import BytesIO
 import re
+from functools import cached_property
+from xml_aws_athena.builder import BatchBuilder, normalize_batch
+from xml_aws_athena.compression import Codec, SUFFIX, compress
+from xml_aws_athena.fields import REF_COLUMN, compile_header, compile_items
+from xml_aws_athena.schema import schema_nota
 
 
 class FileXml:
@@ -27,8 +31,25 @@ class FileXml:
         self.controle = controle
 
     def export_file_xml(
-        self, sub_path: str = None, memory: bool = True
+        self,
+        sub_path: str = None,
+        memory: bool = True,
+        passthrough: bool = False,
+        codec: Codec = None,
     ) -> tuple[str, BytesIO] | tuple[str, None]:
+        """
+        Export the note to ``{controle}/{yyyy/mm/dd}/{chave}_{status}_{yyyymmdd}.xml``.
+        Args:
+            sub_path (str, optional): Prefix of the path. Defaults to None.
+            memory (bool, optional): Return a ``BytesIO`` instead of writing
+                the file. Defaults to True.
+            passthrough (bool, optional): Keep the original payload, encoded
+                once, without parsing and pretty printing it. Defaults to False.
+            codec (Codec, optional): Compress the passthrough payload, adding
+                the codec suffix to the path. Defaults to None.
+        Returns:
+            tuple[str, BytesIO] | tuple[str, None]: Path and content of the file.
+        """
         path_raiz = f"{self.controle}/{self.dtgravacao:%Y/%m/%d}"
         if sub_path:
             path_raiz = f"{sub_path}/{path_raiz}"
@@ -37,6 +58,21 @@ class FileXml:
             f"{path_raiz}/{self.chave}_{self.instatus:02d}_{self.dtgravacao:%Y%m%d}.xml"
         )
 
+        if passthrough:
+            body = self.string_xml.encode("utf-8")
+
+            if codec:
+                body = compress(body, codec)
+                file_to = f"{file_to}{SUFFIX[codec]}"
+
+            if memory:
+                return file_to, BytesIO(body)
+
+            os.makedirs(path_raiz, exist_ok=True)
+            Path(file_to).write_bytes(body)
+
+            return file_to, None
+
         root = ET.fromstring(self.string_xml)
         etree = ET.ElementTree(root)
 
@@ -60,12 +96,28 @@ class ParseXml:
         instatus: int,
         xml: str | Path | BytesIO,
         namespace: str = "{http://www.portalfiscal.inf.br/nfe}",
+        stream: bool = False,
+        clean: bool = True,
     ) -> None:
+        """
+        Args:
+            controle (str): Note type (``controle1``).
+            instatus (int): Note status.
+            xml (str | Path | BytesIO): XML content, file path or buffer.
+            namespace (str, optional): NF-e namespace in Clark notation.
+            stream (bool, optional): Parse with a single ``iterparse`` pass
+                instead of building and walking the whole tree. Defaults to False.
+            clean (bool, optional): Apply ``clear_string`` to every value while
+                parsing. Set to False to normalize whole batches later with
+                ``builder.normalize_batch``. Defaults to True.
+        """
         self.controle = controle
         self.instatus = instatus
         self.xml = xml
         self.namespace = namespace
-        self.root = self.__get_root()
+        self.stream = stream
+        self.clean = clean
+        self.root = None if stream else self.__get_root()
 
     def clear_string(self, txt: Any) -> Any:
         if txt is None:
@@ -91,35 +143,24 @@ class ParseXml:
 
         return root
 
-    def ___header_note(self) -> dict:
-        map_cab = {
-            "chave": ("infNFe/@Id", lambda x: str.strip(x[3:])),
-            "dh_emi": ("infNFe/ide/dhEmi", lambda x: parse(x[:10])),
-            "cnpj_origem": ("infNFe/emit/CNPJ", str),
-            "cnpj_destino": ("infNFe/dest/CNPJ", str),
-            "natureza_operacao": ("infNFe/ide/natOp", str),
-            "numero_nota": ("infNFe/ide/nNF", int),
-            "valor_nota": ("infNFe/total//vNF", float),
-            "valor_prod": ("infNFe/total//vProd", float),
-            "valor_desc": ("infNFe/total//vDesc", float),
-            "valor_base_calculo": ("infNFe/total//vBC", float),
-            "valor_icms": ("infNFe/total//vICMS", float),
-            "valor_ipi": ("infNFe/total//vIPI", float),
-            "valor_pis": ("infNFe/total//vPIS", float),
-            "valor_cofins": ("infNFe/total//vCOFINS", float),
-            "serie": ("infNFe/ide/serie", int),
-            "ref_chave": ("infNFe/ide//refNFe", str),
-        }
+    def __get_source(self) -> str | BytesIO:
+        if isinstance(self.xml, Path):
+            return str(self.xml)
 
-        output = {"controle": self.controle.strip().lower(), "status": self.instatus}
+        if isinstance(self.xml, str):
+            return BytesIO(self.xml.encode("utf-8"))
+
+        return self.xml
 
-        for key, value in map_cab.items():
-            expr, func = value
+    def ___header_note(self, root=None, namespace: str = "") -> dict:
+        root = self.root if root is None else root
+        estorno = self.controle.lower().startswith("estorno")
 
-            if search := self.root.xpath(expr):
-                if key == "ref_chave" and not self.controle.lower().startswith(
-                    "estorno"
-                ):
+        output = {"controle": self.controle.strip().lower(), "status": self.instatus}
+
+        for key, xpath, func in compile_header(namespace):
+            if search := xpath(root):
+                if key == REF_COLUMN and not estorno:
                     continue
 
                 [tag] = search
@@ -127,70 +168,125 @@ class ParseXml:
 
         return output
 
-    def __detail_note(self) -> Generator[dict, Any, None]:
-        cols_det = {
-            "cProd": ("cod", lambda x: int(x.replace("-", ""))),
-            "cEAN": ("cod_barra", str),
-            "xProd": ("nome_prod", str),
-            "NCM": ("ncm", str),
-            "CFOP": ("cfop", int),
-            "uCom": ("und_comercial", str),
-            "qCom": ("qtd", lambda x: int(float(x))),
-            "vUnCom": ("vl_unit", float),
-            "vDesc": ("vl_desc", float),
-            "vProd": ("vl_prod", float),
-            "vBC": ("vl_base", float),
-            "pICMS": ("perc_icms", float),
-            "vICMS": ("vl_icms", float),
-            "pIPI": ("perc_ipi", float),
-            "vIPI": ("vl_ipi", float),
-            "pPIS": ("perc_pis", float),
-            "vPIS": ("vl_pis", float),
-            "pCOFINS": ("perc_cofins", float),
-            "vCOFINS": ("vl_cofins", float),
-            "orig": ("orig", int),
-            "nLote": ("lote", str),
-            "qLote": ("qtd_lote", lambda x: int(float(x))),
-            "dFab": ("dt_fab", lambda x: parse(x)),
-            "dVal": ("dt_val", lambda x: parse(x)),
+    @cached_property
+    def header(self) -> dict:
+        """
+        Cleaned header columns of the note, extracted once per instance.
+        In ``stream`` mode it comes from the same single pass as the items,
+        run here when the header is read first.
+        """
+        if self.stream:
+            header, __ = self.__stream_pass
+            return header
+
+        return self.__clear_row(self.___header_note())
+
+    def __clear_row(self, data: dict) -> dict:
+        if not self.clean:
+            return data
+
+        return {
+            k: self.clear_string(v) if k != "controle" else v for k, v in data.items()
         }
 
+    def __item_note(self, elm, namespace: str = "") -> dict:
+        """Item columns of a ``det`` element."""
+        fields, groups = compile_items(namespace)
+        tag_vbc = f"{namespace}vBC"
+
+        data = {"item": int(elm.get("nItem"))}
+
+        for child in elm.iter(*fields):
+            key, func = fields[child.tag]
+
+            if child.tag == tag_vbc:
+                if group := groups.get(child.getparent().getparent().tag):
+                    data[f"{key}_{group}"] = func(child.text)
+            else:
+                data[key] = func(child.text)
+
+        return data
+
+    def __detail_note(self) -> Generator[dict, Any, None]:
         for child in self.root.findall("infNFe/det"):
-            data = self.___header_note()
+            yield self.__clear_row(self.__item_note(child))
+
+    @cached_property
+    def __stream_pass(self) -> tuple[dict, list[dict]]:
+        """
+        Single ``iterparse`` pass matching the namespaced tags directly.
+
+        Item columns are extracted when each ``det`` closes, then the element
+        is cleared and the ``det`` before it removed, so the tree does not
+        grow with the items. The extracted columns are still kept in a list
+        until the document ends: the note totals, part of the header, only
+        appear after the last ``det``, once ``infNFe`` closes.
+        Returns:
+            tuple[dict, list[dict]]: Cleaned header and raw item columns.
+        """
+        ns = self.namespace
+        tag_det, tag_inf = f"{ns}det", f"{ns}infNFe"
+
+        header, items = None, []
+        context = ET.iterparse(
+            self.__get_source(), events=("end",), tag=(tag_det, tag_inf)
+        )
+
+        for __, elm in context:
+            if elm.tag == tag_inf:
+                header = self.__clear_row(
+                    self.___header_note(elm.getparent(), namespace=ns)
+                )
+                elm.clear()
+                continue
 
-            for elm in child.iter():
-                if elm.tag == "det":
-                    data["item"] = int(elm.get("nItem"))
+            items.append(self.__item_note(elm, ns))
+            elm.clear(keep_tail=True)
 
-                if elm.tag in cols_det.keys():
-                    key, func = cols_det[elm.tag]
+            # the earlier items are already gone, ide/emit/dest stay for the header
+            previous = elm.getprevious()
+            if previous is not None and previous.tag == tag_det:
+                elm.getparent().remove(previous)
 
-                    if elm.tag == "vBC":
-                        if elm.getparent().getparent().tag == "ICMS":
-                            data[f"{key}_icms"] = func(elm.text)
+        if header is None:
+            raise ValueError(f"Elemento {tag_inf} não encontrado na nota")
 
-                        if elm.getparent().getparent().tag == "IPI":
-                            data[f"{key}_ipi"] = func(elm.text)
+        return header, items
 
-                        if elm.getparent().getparent().tag == "PIS":
-                            data[f"{key}_pis"] = func(elm.text)
+    def __stream_note(self) -> Generator[dict, Any, None]:
+        __, items = self.__stream_pass
 
-                        if elm.getparent().getparent().tag == "COFINS":
-                            data[f"{key}_cofins"] = func(elm.text)
+        for data in items:
+            yield self.__clear_row(data)
 
-                    else:
-                        data[key] = func(elm.text)
+    def items(self) -> Generator[dict, Any, None]:
+        """Cleaned item-only columns, without the header."""
+        return self.__stream_note() if self.stream else self.__detail_note()
 
-            yield {
-                k: self.clear_string(v) if k != "controle" else v
-                for k, v in data.items()
-            }
+    def __rows(self) -> Generator[dict, Any, None]:
+        for data in self.items():
+            yield {**self.header, **data}
 
     def records(self) -> list[dict[str, Any]]:
-        return self.__detail_note()
+        return self.__rows()
+
+    def arrow(self, compact: bool = False) -> pa.Table:
+        """
+        Args:
+            compact (bool, optional): Keep the repetitive string columns
+                dictionary encoded, in ``schema_compact``. Defaults to False,
+                plain strings in ``schema_nota``.
+        """
+        builder = BatchBuilder()
+        builder.append(self)
+
+        batch = builder.flush()
+        if not self.clean:
+            batch = normalize_batch(batch)
+
+        table = pa.Table.from_batches([batch])
 
-    def arrow(self) -> pa.Table:
-        return pa.Table.from_pylist([*self.__detail_note()])
+        return table if compact else table.cast(schema_nota)
 
     def df(self) -> pd.DataFrame:
-        return pd.DataFrame.from_records(self.__detail_note(), coerce_float=True)
+        return pd.DataFrame.from_records(self.__rows(), coerce_float=True)
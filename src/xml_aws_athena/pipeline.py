@@ -0,0 +1,376 @@
+from xml_aws_athena.cloud import MAX_POOL_CONNECTIONS, Storage
+from xml_aws_athena.connect import iter_notes
+from xml_aws_athena.builder import SpillBuffer
+from xml_aws_athena.schema import schema_compact
+from xml_aws_athena.keys import KeyIndex
+from xml_aws_athena.maintenance import maintain_silver
+from xml_aws_athena.raw import BUCKET_NAME, upload_file
+from xml_aws_athena.silver import (
+    MEMORY_BUDGET,
+    Engine,
+    parse_chunk,
+    write_ipc_buffer,
+    write_silver,
+)
+import xml_aws_athena.write as Write
+import pyarrow as pa
+import os
+import logging
+import threading
+from queue import Queue, Empty, Full
+from datetime import datetime
+from itertools import islice
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from typing import Any, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+DONE = object()
+
+
+class Pipeline:
+    """
+    Extraction, raw upload, parsing and silver writes running as concurrent
+    stages connected by bounded queues.
+
+    A full queue blocks the stage that feeds it, so a slow stage holds back
+    the ones before it instead of piling notes up in memory. The first error
+    in any stage stops all of them and is raised by ``run``.
+    """
+
+    def __init__(
+        self,
+        upload_workers: int = os.cpu_count(),
+        parse_workers: int = os.cpu_count(),
+        queue_size: int = 1_000,
+        chunk_size: int = 50,
+        batch_notes: int = 1_000,
+        engine: Engine = "thread",
+        memory_budget: int = MEMORY_BUDGET,
+    ) -> None:
+        """
+        Args:
+            upload_workers (int, optional): Threads uploading to the raw layer.
+            parse_workers (int, optional): Threads parsing chunks of notes.
+            queue_size (int, optional): Notes held between two stages.
+            chunk_size (int, optional): Notes parsed per task.
+            batch_notes (int, optional): Notes per write to the silver table.
+            engine (Engine, optional): ``process`` sends the chunks to a
+                process pool with ``parse_workers`` processes. Defaults to "thread".
+            memory_budget (int, optional): Bytes of a silver batch kept in
+                memory before spilling to disk.
+        """
+        self.upload_workers = upload_workers
+        self.parse_workers = parse_workers
+        self.queue_size = queue_size
+        self.chunk_size = chunk_size
+        self.batch_notes = batch_notes
+        self.engine = engine
+        self.memory_budget = memory_budget
+
+        self.stop = threading.Event()
+        self.commits = 0
+        self.errors: list[Exception] = []
+        self.metrics: dict[str, dict[str, float]] = {}
+        self.lock = threading.Lock()
+
+    def __put(self, queue: Queue, item: Any) -> bool:
+        while not self.stop.is_set():
+            try:
+                queue.put(item, timeout=0.5)
+                return True
+            except Full:
+                continue
+
+        return False
+
+    def __get(self, queue: Queue) -> Any:
+        while not self.stop.is_set():
+            try:
+                return queue.get(timeout=0.5)
+            except Empty:
+                continue
+
+        return DONE
+
+    def __record(
+        self, stage: str, items: int, elapsed: float, failures: int = 0
+    ) -> None:
+        with self.lock:
+            metric = self.metrics.setdefault(
+                stage, {"itens": 0, "falhas": 0, "segundos": 0.0}
+            )
+            metric["itens"] += items
+            metric["falhas"] += failures
+            metric["segundos"] += elapsed
+
+    def __start(
+        self, stage: str, workers: int, target: Callable, queue: Queue, consumers: int
+    ) -> list[threading.Thread]:
+        """
+        Start ``workers`` threads of a stage. The last one to finish sends a
+        ``DONE`` to each of the ``consumers`` of the next stage.
+        """
+        alive = [workers]
+
+        def work() -> None:
+            try:
+                target()
+            except Exception as e:
+                logger.exception(f"Erro na etapa {stage}")
+                self.errors.append(e)
+                self.stop.set()
+            finally:
+                with self.lock:
+                    alive[0] -= 1
+                    last = alive[0] == 0
+
+                if last:
+                    for __ in range(consumers):
+                        self.__put(queue, DONE)
+
+        threads = [
+            threading.Thread(target=work, name=f"{stage}-{pos}", daemon=True)
+            for pos in range(workers)
+        ]
+
+        for thread in threads:
+            thread.start()
+
+        return threads
+
+    def run(
+        self,
+        notes: Iterable[tuple],
+        client: Storage = None,
+        put_object: bool = True,
+        limit: int = None,
+    ) -> bool:
+        """
+        Run all stages until ``notes`` is exhausted.
+        Args:
+            notes (Iterable[tuple]): Rows from ``iter_notes``.
+            client (Storage, optional): Storage client for the raw upload.
+            put_object (bool, optional): Flag to upload the objects.
+            limit (int, optional): Limit of notes. Defaults to None.
+        Returns:
+            bool: True when any batch was merged into an existing silver table.
+                Notes whose raw upload failed are not written to the silver
+                table and are counted in ``metrics["raw"]["falhas"]``.
+        """
+        self.stop.clear()
+        self.commits = 0
+        self.errors.clear()
+        self.metrics.clear()
+
+        q_upload = Queue(self.queue_size)
+        q_parse = Queue(self.queue_size)
+        q_write = Queue(max(2, self.parse_workers * 2))
+
+        pool = (
+            ProcessPoolExecutor(self.parse_workers)
+            if self.engine == "process"
+            else nullcontext()
+        )
+
+        def extract() -> None:
+            start = perf_counter()
+            count = 0
+
+            try:
+                for nota in enumerate(islice(notes, limit)):
+                    if not self.__put(q_upload, nota):
+                        break
+                    count += 1
+            finally:
+                # releases the database connection of iter_notes
+                if close := getattr(notes, "close", None):
+                    close()
+
+            self.__record("extracao", count, perf_counter() - start)
+
+        def upload() -> None:
+            while (nota := self.__get(q_upload)) is not DONE:
+                start = perf_counter()
+                uploaded = upload_file(client, nota, put_object=put_object)
+                self.__record("raw", 1, perf_counter() - start, uploaded is None)
+
+                # a note missing from the raw layer is not written to the silver
+                if uploaded is None:
+                    continue
+
+                if not self.__put(q_parse, nota):
+                    break
+
+        def parse() -> None:
+            done = False
+
+            while not done:
+                if (nota := self.__get(q_parse)) is DONE:
+                    break
+
+                chunk = [nota]
+                while len(chunk) < self.chunk_size:
+                    try:
+                        nota = q_parse.get_nowait()
+                    except Empty:
+                        break
+
+                    if nota is DONE:
+                        done = True
+                        break
+
+                    chunk.append(nota)
+
+                start = perf_counter()
+                if executor:
+                    buffer = executor.submit(
+                        write_ipc_buffer,
+                        tuple((pos, tuple(data)) for pos, data in chunk),
+                    ).result()
+                    batches = [*pa.ipc.open_stream(buffer)]
+                else:
+                    batches = parse_chunk(tuple(chunk))
+                self.__record("parse", len(chunk), perf_counter() - start)
+
+                if not self.__put(q_write, (len(chunk), batches)):
+                    break
+
+        with pool as executor:
+            threads = [
+                *self.__start("extracao", 1, extract, q_upload, self.upload_workers),
+                *self.__start(
+                    "raw", self.upload_workers, upload, q_parse, self.parse_workers
+                ),
+                *self.__start("parse", self.parse_workers, parse, q_write, 1),
+            ]
+
+            try:
+                merge = self.__write(q_write)
+            except Exception as e:
+                self.errors.append(e)
+                self.stop.set()
+                raise
+            finally:
+                for thread in threads:
+                    thread.join()
+
+        if self.errors:
+            raise self.errors[0]
+
+        for stage, metric in self.metrics.items():
+            logger.info(
+                f"Etapa {stage}: {metric['itens']:.0f} itens, "
+                f"{metric['falhas']:.0f} falhas, {metric['segundos']:.2f}s de trabalho"
+            )
+
+        if failures := self.metrics.get("raw", {}).get("falhas"):
+            logger.error(
+                f"{failures:.0f} notas falharam no upload e não foram gravadas"
+            )
+
+        return merge
+
+    def __write(self, q_write: Queue) -> bool:
+        """Silver stage, batches of ``batch_notes`` notes to the Delta table."""
+        merge = False
+        total = notes = 0
+        buffer = SpillBuffer(schema_compact, self.memory_budget)
+        index = KeyIndex()
+
+        try:
+            while (item := self.__get(q_write)) is not DONE:
+                count, batches = item
+                for batch in batches:
+                    buffer.write(batch)
+
+                notes += count
+                if notes < self.batch_notes:
+                    continue
+
+                total += notes
+                start = perf_counter()
+                merge |= write_silver(buffer, total, index)
+                self.commits += 1
+                self.__record("silver", notes, perf_counter() - start)
+
+                buffer.close()
+                buffer = SpillBuffer(schema_compact, self.memory_budget)
+                notes = 0
+
+            if self.stop.is_set():
+                return merge
+
+            if notes:
+                total += notes
+                start = perf_counter()
+                merge |= write_silver(buffer, total, index)
+                self.commits += 1
+                self.__record("silver", notes, perf_counter() - start)
+        finally:
+            buffer.close()
+
+        return merge
+
+
+def command_pipeline(
+    server: str,
+    database: str,
+    tips: list[str],
+    start: datetime,
+    end: datetime,
+    limit: int = None,
+    put_object: bool = True,
+    font: str = "dbnfe",
+    **kwargs,
+) -> pa.RecordBatchReader:
+    """
+    Extract, upload to the raw layer and write the silver table as one
+    overlapped pipeline instead of ``comand_raw`` followed by ``command_silver``.
+    Args:
+        server (str): Server name.
+        database (str): Database name.
+        tips (list[str]): List of tips.
+        start (datetime): Start date.
+        end (datetime): End date.
+        limit (int, optional): Limit of notes. Defaults to None.
+        put_object (bool, optional): Flag to upload the objects. Defaults to True.
+        **kwargs: Stage settings passed to ``Pipeline``.
+    Returns:
+        pa.RecordBatchReader: Silver rows between ``start`` and ``end``.
+    """
+    logger.info(f"Consultando notas entre {start} e {end}...")
+
+    pipeline = Pipeline(**kwargs)
+
+    client = Storage(
+        max_pool_connections=max(MAX_POOL_CONNECTIONS, pipeline.upload_workers)
+    )
+    if client.create_bucket(BUCKET_NAME):
+        logger.info(f"Bucket {BUCKET_NAME} criado com sucesso.")
+
+    notes = iter_notes(
+        server=server,
+        database=database,
+        tips=tips,
+        start=start,
+        end=end,
+        font=font,
+    )
+
+    if Write.is_delta_table() and Write.enable_change_data_feed():
+        logger.info("Change data feed habilitado na tabela Delta Lake")
+
+    merge = pipeline.run(notes, client, put_object=put_object, limit=limit)
+
+    if not pipeline.metrics.get("extracao", {}).get("itens"):
+        logger.warning("Nenhum registro encontrado.")
+        raise ValueError("Nenhum registro encontrado.")
+
+    if pipeline.commits:
+        logger.info("Manutenção da tabela Delta Lake")
+        maintain_silver(changed=merge)
+
+    return Write.read_deltalake_aws(start, end)
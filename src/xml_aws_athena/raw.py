@@ -1,12 +1,16 @@
 from xml_aws_athena.cloud import Storage
-from xml_aws_athena.connect import iter_notes
+from xml_aws_athena.connect import iter_notes, iter_notes_range, iter_notes_sharded
+from xml_aws_athena.state import StateStore
+from xml_aws_athena.manifest import UploadManifest
+from xml_aws_athena.pack import upload_packs
+from xml_aws_athena.compression import Codec, CONTENT_ENCODING
 from xml_aws_athena.parser import FileXml
-import os
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
 from itertools import islice
 from concurrent.futures import ThreadPoolExecutor
 from functools import partial
+from typing import Iterable, Literal
 from xml_aws_athena import config
 
 logger = logging.getLogger(__name__)
@@ -14,30 +18,112 @@ CAMADA_RAW = "raw"
 BUCKET_NAME = config.get("bucket_xml")
 
 
-def upload_file(client: Storage, notas: tuple, put_object: bool = True) -> tuple:
+def upload_file(
+    client: Storage,
+    notas: tuple,
+    put_object: bool = True,
+    manifest: UploadManifest = None,
+    passthrough: bool = False,
+    codec: Codec = None,
+    bucket: str = None,
+) -> tuple:
     """
     Upload XML file to S3 bucket.
     Args:
         client (Storage): Storage client.
         notas (tuple): Tuple containing position and data.
         put_object (bool, optional): Flag to upload the object. Defaults to True.
+        manifest (UploadManifest, optional): Skip the upload when the same
+            content was already uploaded to the same path. Defaults to None.
+        passthrough (bool, optional): Upload the original payload without
+            parsing it. Defaults to False.
+        codec (Codec, optional): Compress the passthrough payload and set its
+            ``Content-Encoding``. Defaults to None.
+        bucket (str, optional): Bucket of the raw layer. Defaults to BUCKET_NAME.
     Returns:
-        str: S3 path where the file was uploaded.
+        tuple | None: The note, or None when its upload failed.
     """
+    bucket = bucket or BUCKET_NAME
     pos, data = notas
     file = FileXml(*data)
-    file_to, file_xml = file.export_file_xml()
+    file_to, file_xml = file.export_file_xml(passthrough=passthrough, codec=codec)
+    encoding = CONTENT_ENCODING.get(codec) if passthrough else None
 
     file_raw_to = f"{CAMADA_RAW}/{file_to}"
 
     if put_object:
-        client.put_object_file(file_xml, BUCKET_NAME, file_raw_to)
+        body = file_xml.getvalue() if manifest else None
+
+        if manifest and manifest.is_unchanged(file_raw_to, body):
+            logger.info(f"Nota - {pos:02d} - {file_raw_to}, sem alteração")
+            return notas
+
+        if not client.put_object_file(file_xml, bucket, file_raw_to, encoding):
+            logger.error(f"Nota - {pos:02d} - {file_raw_to}, falha no upload")
+            return None
+
+        if manifest:
+            manifest.record(file_raw_to, body)
 
     logger.info(f"Nota - {pos:02d} - {file_raw_to}, s3: {put_object}")
 
     return notas
 
 
+def upload_notes(
+    client: Storage,
+    gen_notas: list[tuple],
+    put_object: bool = True,
+    skip_unchanged: bool = False,
+    passthrough: bool = False,
+    codec: Codec = None,
+    bucket: str = None,
+) -> list[tuple]:
+    """
+    Upload every note as its own object.
+    Args:
+        client (Storage): Storage client.
+        gen_notas (list[tuple]): Tuples containing position and data.
+        put_object (bool, optional): Flag to upload the objects. Defaults to True.
+        skip_unchanged (bool, optional): Skip the notes already uploaded with
+            the same content. Defaults to False.
+        passthrough (bool, optional): Upload the original payloads without
+            parsing them. Defaults to False.
+        codec (Codec, optional): Compression of the passthrough payloads.
+            Defaults to None.
+        bucket (str, optional): Bucket of the raw layer. Defaults to BUCKET_NAME.
+    Returns:
+        list[tuple]: The uploaded notes, without the ones whose upload failed.
+    """
+    bucket = bucket or BUCKET_NAME
+
+    manifest = None
+    if skip_unchanged:
+        manifest = UploadManifest(client, bucket, config.get("manifest_path"))
+
+    with ThreadPoolExecutor(max_workers=client.max_pool_connections) as executor:
+        rst = executor.map(
+            partial(
+                upload_file,
+                client,
+                put_object=put_object,
+                manifest=manifest,
+                passthrough=passthrough,
+                codec=codec,
+                bucket=bucket,
+            ),
+            gen_notas,
+        )
+
+    rst = [notas for notas in rst if notas is not None]
+    logger.info(f"Upload raw: {client.metrics}")
+
+    if manifest:
+        manifest.save()
+
+    return rst
+
+
 def comand_raw(
     server: str,
     database: str,
@@ -47,6 +133,17 @@ def comand_raw(
     limit: int = None,
     put_object: bool = True,
     font: str = "dbnfe",
+    shard_by: Literal["day", "hour"] = None,
+    connections: int = 4,
+    incremental: bool = False,
+    state: StateStore = None,
+    lookback: timedelta = timedelta(minutes=10),
+    skip_unchanged: bool = False,
+    packed: Codec = None,
+    passthrough: bool = False,
+    codec: Codec = None,
+    bucket: str = None,
+    source: Iterable[tuple] = None,
 ) -> list[tuple]:
     """
     Upload XML files to S3 bucket.
@@ -57,26 +154,100 @@ def comand_raw(
         start (datetime): Start date.
         end (datetime): End date.
         limit (int, optional): Limit of files to upload. Defaults to None.
+        shard_by (Literal["day", "hour"], optional): Extract the window in
+            sub-ranges on ``connections`` concurrent connections. Defaults to None.
+        connections (int, optional): Connections used by ``shard_by``. Defaults to 4.
+        incremental (bool, optional): Fetch only the notes recorded after the
+            last run's watermark on ``dthGravacao`` (minus ``lookback``) that
+            were not processed yet. Defaults to False.
+        state (StateStore, optional): Store of the watermark and processed
+            notes. Defaults to None, the store at ``STATE_PATH``.
+        lookback (timedelta, optional): Overlap with the previous run, for
+            rows committed late. Defaults to 10 minutes.
+        skip_unchanged (bool, optional): Keep a content hash manifest next to
+            the objects and skip the ones already uploaded with the same
+            content. Defaults to False.
+        packed (Codec, optional): Upload one pack per folder, compressed with
+            this codec, instead of one object per note. The notes are always
+            packed as they are, so it cannot be combined with
+            ``skip_unchanged``, ``passthrough`` or ``codec``. Defaults to None.
+        passthrough (bool, optional): Upload the original payload of each note,
+            encoded once, without parsing and pretty printing it. Defaults to False.
+        codec (Codec, optional): Compress the passthrough objects, with the
+            matching ``Content-Encoding``. Defaults to None.
+        bucket (str, optional): Bucket of the raw layer. Defaults to BUCKET_NAME.
+        source (Iterable[tuple], optional): Rows shaped like ``iter_notes``
+            uploaded as they are, in place of the query on ``server``.
+            Defaults to None.
     Returns:
-        list[str]: List of S3 paths where the files were uploaded.
+        list[tuple]: The uploaded notes, without the ones whose upload failed.
     """
+    bucket = bucket or BUCKET_NAME
+
+    if packed and (skip_unchanged or passthrough or codec):
+        raise ValueError(
+            "packed não pode ser combinado com skip_unchanged, passthrough ou codec"
+        )
+
     logger.info(f"Consultando notas entre {start} e {end}...")
 
-    gen_notas = [
-        *enumerate(
-            islice(
-                iter_notes(
-                    server=server,
-                    database=database,
-                    tips=tips,
-                    start=start,
-                    end=end,
-                    font=font,
-                ),
-                limit,
-            )
+    watermark = f"raw:{font}:{','.join(sorted(tips))}"
+
+    if incremental:
+        state = state or StateStore()
+
+    if source is not None:
+        notes = source
+    elif incremental:
+        lower = datetime(start.year, start.month, start.day)
+
+        if since := state.get_watermark(watermark):
+            lower = max(lower, since - lookback)
+
+        logger.info(f"Modo incremental a partir de {lower}")
+        notes = iter_notes_range(
+            server=server,
+            database=database,
+            tips=tips,
+            start=lower,
+            end=datetime(end.year, end.month, end.day) + timedelta(days=1),
+            font=font,
+        )
+    elif shard_by:
+        notes = iter_notes_sharded(
+            server=server,
+            database=database,
+            tips=tips,
+            start=start,
+            end=end,
+            font=font,
+            by=shard_by,
+            workers=connections,
+        )
+    else:
+        notes = iter_notes(
+            server=server,
+            database=database,
+            tips=tips,
+            start=start,
+            end=end,
+            font=font,
         )
-    ]
+
+    gen_notas = [*enumerate(islice(notes, limit))]
+
+    if incremental:
+        processed = state.is_processed((row[1], row[2]) for __, row in gen_notas)
+        gen_notas = [
+            *enumerate(
+                row for __, row in gen_notas if (row[1], row[2]) not in processed
+            )
+        ]
+        logger.info(f"Notas já processadas: {len(processed)}")
+
+        if not gen_notas:
+            logger.info("Nenhuma nota nova.")
+            return []
 
     register = len(gen_notas)
     logger.info(f"Total de notas: {len(gen_notas)}")
@@ -86,12 +257,32 @@ def comand_raw(
         raise ValueError("Nenhum registro encontrado.")
 
     client = Storage()
-    if client.create_bucket(BUCKET_NAME):
-        logger.info(f"Bucket {BUCKET_NAME} criado com sucesso.")
+    if client.create_bucket(bucket):
+        logger.info(f"Bucket {bucket} criado com sucesso.")
 
-    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
-        rst = executor.map(
-            partial(upload_file, client, put_object=put_object), gen_notas
+    if packed:
+        packs = upload_packs(
+            client, bucket, gen_notas, CAMADA_RAW, packed, put_object=put_object
         )
+        rst = [notas for notes in packs.values() for notas in notes]
+    else:
+        rst = upload_notes(
+            client, gen_notas, put_object, skip_unchanged, passthrough, codec, bucket
+        )
+
+    if len(rst) < register:
+        logger.error(f"Falha no upload de {register - len(rst)} notas")
+
+    if incremental:
+        uploaded = {(row[1], row[2]) for __, row in rst}
+        state.mark_processed(uploaded)
+
+        failed = [row[3] for __, row in gen_notas if (row[1], row[2]) not in uploaded]
+        # the next run starts again from the oldest failed note
+        latest = min(failed) if failed else max(row[3] for __, row in rst)
+        if previous := state.get_watermark(watermark):
+            latest = max(latest, previous)
+
+        state.set_watermark(watermark, latest)
 
-    return list(rst)
+    return rst
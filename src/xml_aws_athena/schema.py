@@ -50,3 +50,35 @@ schema_nota = pa.schema(
         pa.field("dt_val", pa.timestamp("us")),
     ]
 )
+
+# string columns that repeat heavily within and across notes
+dictionary_columns = (
+    "controle",
+    "natureza_operacao",
+    "cnpj_origem",
+    "cnpj_destino",
+    "und_comercial",
+    "ncm",
+    "nome_prod",
+)
+
+# ``schema_nota`` with ``dictionary_columns`` dictionary encoded, for batches in memory
+schema_compact = pa.schema(
+    [
+        field.with_type(pa.dictionary(pa.int32(), field.type))
+        if field.name in dictionary_columns
+        else field
+        for field in schema_nota
+    ]
+)
+
+# Partitions of the silver table, ``year``/``month`` derived from ``dh_emi``
+partition_by = ["controle", "year", "month"]
+
+schema_silver = pa.schema(
+    [
+        *schema_nota,
+        pa.field("year", pa.int16()),
+        pa.field("month", pa.int8()),
+    ]
+)
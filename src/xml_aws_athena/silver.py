@@ -1,85 +1,285 @@
-import tempfile
-import pyarrow.parquet as pq
 from xml_aws_athena.parser import ParseXml
-from xml_aws_athena.schema import schema_nota
+from xml_aws_athena.builder import SpillBuffer, iter_batches
+from xml_aws_athena import config
+from xml_aws_athena.schema import schema_compact, schema_nota
+from xml_aws_athena.keys import KeyIndex
+from xml_aws_athena.maintenance import maintain_silver
 import pyarrow as pa
-from itertools import islice
+import pyarrow.compute as pc
+from itertools import batched, islice
 import logging
 import xml_aws_athena.write as Write
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
 import os
-from functools import partial
+from time import perf_counter
+from typing import Any, Callable, Generator, Literal
 
 
 logger = logging.getLogger(__name__)
 
+Engine = Literal["thread", "process"]
 
-def write_parquet_file(data: tuple, tmpdirname: str) -> tuple:
+# bytes of parsed batches kept in memory before spilling to disk
+MEMORY_BUDGET = int(config.get("silver_memory_budget", 512 * 2**20))
+
+# notes parsed at a time, and rows / Arrow bytes staged per write_silver call
+PARSE_NOTES = 1_000
+BATCH_ROWS = int(config.get("silver_batch_rows", 1_000_000))
+BATCH_BYTES = int(config.get("silver_batch_bytes", 256 * 2**20))
+
+
+def parse_chunk(chunk: tuple[tuple, ...]) -> list[pa.RecordBatch]:
+    """
+    Parse a chunk of notes into record batches in ``schema_compact``.
+    Args:
+        chunk (tuple[tuple, ...]): Tuples containing position and data.
+    Returns:
+        list[pa.RecordBatch]: Batches with the items of the notes.
+    """
+    files = (
+        ParseXml(controle, instatus, xml, stream=True, clean=False)
+        for __, (xml, __, instatus, __, controle) in chunk
+    )
+
+    return [*iter_batches(files, normalize=True)]
+
+
+def write_ipc_buffer(chunk: tuple[tuple, ...]) -> pa.Buffer:
+    """
+    Parse a chunk of notes into an Arrow IPC stream, used by the process engine.
+    Args:
+        chunk (tuple[tuple, ...]): Tuples containing position and data.
+    Returns:
+        pa.Buffer: IPC stream with the notes in ``schema_compact``.
+    """
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema_compact) as writer:
+        for batch in parse_chunk(chunk):
+            writer.write_batch(batch)
+
+    return sink.getvalue()
+
+
+def read_batches(
+    rst: list[tuple], engine: Engine = "thread", executor: Executor = None
+) -> Generator[pa.RecordBatch, Any, None]:
+    """
+    Parse the notes in chunks and yield the record batches in memory.
+    Args:
+        rst (list[tuple]): Tuples containing position and data.
+        engine (Engine, optional): ``thread`` parses the chunks on a thread
+            pool, ``process`` on a process pool whose workers return Arrow IPC
+            buffers. Defaults to "thread".
+        executor (Executor, optional): Process pool reused between calls.
+            Defaults to None, a new pool per call.
+    """
+    start = perf_counter()
+    chunksize = max(1, -(-len(rst) // (os.cpu_count() * 4)))
+
+    try:
+        if engine == "process":
+            logger.info("Processando notas em processos...")
+            pool = nullcontext(executor) if executor else ProcessPoolExecutor()
+
+            # pyodbc rows are sent to the workers as plain tuples
+            chunks = batched(((pos, tuple(data)) for pos, data in rst), chunksize)
+
+            with pool as executor:
+                for buffer in executor.map(write_ipc_buffer, chunks):
+                    yield from pa.ipc.open_stream(buffer)
+        else:
+            logger.info("Processando notas em threads...")
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+                for batches in executor.map(parse_chunk, batched(rst, chunksize)):
+                    yield from batches
+    finally:
+        # also logged when the consumer stops early or a chunk fails
+        elapsed = perf_counter() - start
+        logger.info(
+            f"Engine {engine}: {len(rst)} notas em {elapsed:.2f}s "
+            f"({len(rst) / elapsed if elapsed else 0:.1f} notas/s)"
+        )
+
+
+def read_parquet_temp(
+    rst: list[tuple],
+    engine: Engine = "thread",
+    executor: Executor = None,
+    compact: bool = False,
+) -> pa.Table:
     """
-    Write XML data to a temporary Parquet file.
+    Parse the notes into a table in ``schema_nota``, concatenating the
+    batches in memory, without temporary Parquet files.
     Args:
-        data (tuple): Tuple containing position and data.
+        compact (bool, optional): Keep the batches in ``schema_compact``,
+            without decoding the dictionary columns. Defaults to False.
+    """
+    table = pa.Table.from_batches(read_batches(rst, engine, executor), schema_compact)
+
+    return table if compact else table.cast(schema_nota)
+
+
+def compare_engines(rst: list[tuple]) -> dict[str, float]:
+    """
+    Parse the same notes with both engines and report the throughput.
     Returns:
-        tuple: Tuple containing position and file path.
+        dict[str, float]: Notes per second by engine.
     """
-    pos, (xml, __, instatus, __, controle) = data
-    file = ParseXml(controle, instatus, xml)
-    file_path = f"{tmpdirname}/{pos:02d}.parquet"
-    pq.write_table(file.arrow(), file_path)
-    return pos, file_path
+    output = {}
+
+    for engine in ("thread", "process"):
+        start = perf_counter()
+        read_parquet_temp(rst, engine=engine, compact=True)
+        output[engine] = len(rst) / (perf_counter() - start)
 
+    logger.info(
+        f"Throughput thread: {output['thread']:.1f} notas/s, "
+        f"process: {output['process']:.1f} notas/s "
+        f"({output['process'] / output['thread']:.2f}x)"
+    )
 
-def write_parquet_buffer(data: tuple) -> pa.BufferOutputStream:
+    return output
+
+
+def write_silver(buffer: SpillBuffer, total: int, index: KeyIndex = None) -> bool:
     """
-    Write XML data to a Parquet buffer.
+    Write the buffered batches to the silver Delta table, creating it if
+    needed. Rows whose key is not in the key index are appended, the others
+    are merged. The batches are streamed from the buffer on each pass,
+    never read back into one table.
     Args:
-        data (tuple): Tuple containing position and data.
+        buffer (SpillBuffer): Parsed batches.
+        total (int): Notes processed so far, for logging.
+        index (KeyIndex, optional): Key index kept between calls. Defaults
+            to None, a new one.
     Returns:
-        pa.BufferOutputStream: Buffer containing the Parquet data.
+        bool: True when rows were merged into an existing table.
     """
-    __, (xml, __, instatus, __, controle) = data
-    file = ParseXml(controle, instatus, xml)
+    if buffer.spilled:
+        logger.info(f"Lote de {buffer.nbytes / 2**20:.1f} MB em disco")
+
+    index = KeyIndex() if index is None else index
+
+    if not Write.is_delta_table():
+        logger.info(f"Criando tabela Delta Lake {total} registros")
+        index.invalidate()
+
+        # lost the race to another writer: append or merge below instead
+        if Write.write_deltalake_aws(buffer.reader):
+            if (current := Write.table_version()) == 0:
+                index.add(buffer.reader(), current)
+            return False
+
+    index.sync()
+    masks = [index.exists(batch) for batch in buffer.reader()]
+    existing = sum(pc.sum(mask).as_py() or 0 for mask in masks)
+    news = buffer.num_rows - existing
+    version, commits = index.version, 0
 
-    buffer = pa.BufferOutputStream()
-    pq.write_table(file.arrow(), buffer, compression="zstd")
+    def rows(exists: bool) -> Callable[[], pa.RecordBatchReader]:
+        def reader() -> pa.RecordBatchReader:
+            batches = (
+                batch.filter(mask if exists else pc.invert(mask))
+                for batch, mask in zip(buffer.reader(), masks)
+            )
+            return pa.RecordBatchReader.from_batches(
+                buffer.schema, (batch for batch in batches if batch.num_rows)
+            )
 
-    return buffer
+        return reader
 
+    if news:
+        logger.info(f"Anexando {news} linhas novas, {total} registros")
+        Write.append_deltalake_aws(rows(exists=False))
+        commits += 1
 
-def read_parquet_temp(rst: list[tuple]) -> pa.Table:
-    logger.info("Escrevendo arquivos temporários em parquet...")
-    with tempfile.TemporaryDirectory(prefix="xml_mssql") as tmpdirname:
-        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
-            __ = executor.map(partial(write_parquet_file, tmpdirname=tmpdirname), rst)
+    if existing:
+        logger.info(f"Atualizando {existing} linhas, {total} registros")
+        Write.merge_deltalake_aws(rows(exists=True))
+        commits += 1
 
-        tbl_full = pq.ParquetDataset(tmpdirname, schema=schema_nota)
-        tbl_full = tbl_full.read(use_threads=True)
+    # another writer committed in between, the index no longer matches
+    if len(changes := Write.data_commits(version)) == commits:
+        index.add(buffer.reader(), changes[0] if changes else version)
+    else:
+        index.invalidate()
 
-    return tbl_full
+    return existing > 0
 
 
-def command_silver(start: datetime, end: datetime, rst: list[tuple]):
+def command_silver(
+    start: datetime,
+    end: datetime,
+    rst: list[tuple],
+    engine: Engine = "thread",
+    memory_budget: int = MEMORY_BUDGET,
+    batch_rows: int = BATCH_ROWS,
+    batch_bytes: int = BATCH_BYTES,
+    single_commit: bool = False,
+) -> pa.RecordBatchReader:
+    """
+    Parse the notes and write them to the silver Delta table.
+    Args:
+        start (datetime): Start date of the returned rows.
+        end (datetime): End date of the returned rows.
+        rst (list[tuple]): Tuples containing position and data.
+        engine (Engine, optional): Parsing engine. Defaults to "thread".
+        memory_budget (int, optional): Bytes staged in memory before spilling
+            to disk. Defaults to MEMORY_BUDGET.
+        batch_rows (int, optional): Rows staged per ``write_silver`` call.
+            Defaults to BATCH_ROWS.
+        batch_bytes (int, optional): Arrow bytes staged per ``write_silver``
+            call. Defaults to BATCH_BYTES.
+        single_commit (bool, optional): Stage every batch and write them in
+            one ``write_silver`` call, an append of the new rows and a merge
+            of the existing ones, up to two Delta commits. Defaults to False.
+    Returns:
+        pa.RecordBatchReader: Silver rows between ``start`` and ``end``.
+    """
     logger.info(f"Total de {len(rst)} registros para processar")
 
     iterar = iter(rst)
     merge = False
-    total = 0
+    total = writes = 0
 
-    while lotes := list(islice(iterar, 1_000)):
-        tbl_full = read_parquet_temp(lotes)
-        total += len(lotes)
+    if Write.is_delta_table() and Write.enable_change_data_feed():
+        logger.info("Change data feed habilitado na tabela Delta Lake")
 
-        if not Write.is_delta_table():
-            logger.info(f"Criando tabela Delta Lake {total} registros")
-            Write.write_deltalake_aws(tbl_full, schema_nota)
-        else:
-            merge = True
-            logger.info(f"Atualizando tabela Delta Lake {total} registros")
-            Write.merge_deltalake_aws(tbl_full)
+    pool = ProcessPoolExecutor() if engine == "process" else nullcontext()
+    buffer = SpillBuffer(schema_compact, memory_budget)
+    index = KeyIndex()
+
+    try:
+        with pool as executor:
+            while lotes := list(islice(iterar, PARSE_NOTES)):
+                total += len(lotes)
+
+                for batch in read_batches(lotes, engine, executor):
+                    buffer.write(batch)
+
+                if single_commit or (
+                    buffer.num_rows < batch_rows and buffer.nbytes < batch_bytes
+                ):
+                    continue
+
+                merge |= write_silver(buffer, total, index)
+                writes += 1
+
+                buffer.close()
+                buffer = SpillBuffer(schema_compact, memory_budget)
+
+        if buffer.num_rows:
+            merge |= write_silver(buffer, total, index)
+            writes += 1
+    finally:
+        buffer.close()
+
+    logger.info(f"{total} notas gravadas em {writes} lotes, {Write.commit_metrics}")
 
-    if merge:
-        logger.info("Otimizando tabela Delta Lake")
-        Write.delta_optimize_aws()
+    if writes:
+        logger.info("Manutenção da tabela Delta Lake")
+        maintain_silver(changed=merge)
 
     return Write.read_deltalake_aws(start, end)
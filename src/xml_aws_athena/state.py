@@ -0,0 +1,95 @@
+import sqlite3
+from datetime import datetime
+from itertools import batched
+from typing import Iterable
+from xml_aws_athena import config
+
+STATE_PATH = config.get("state_path", "xml_state.sqlite3")
+
+
+class StateStore:
+    """
+    Local SQLite store with the watermarks of the incremental runs and the
+    ``(codChaveAcesso, isnStatus)`` pairs already processed.
+    """
+
+    def __init__(self, path: str = STATE_PATH) -> None:
+        self.path = path
+        self.con = sqlite3.connect(path)
+
+        with self.con:
+            self.con.execute(
+                """
+                create table if not exists watermark (
+                    name text primary key,
+                    value text not null
+                )
+                """
+            )
+            self.con.execute(
+                """
+                create table if not exists processed (
+                    chave text not null,
+                    status integer not null,
+                    primary key (chave, status)
+                ) without rowid
+                """
+            )
+
+    def get_value(self, name: str) -> str | None:
+        row = self.con.execute(
+            "select value from watermark where name = ?", (name,)
+        ).fetchone()
+
+        return row[0] if row else None
+
+    def set_value(self, name: str, value: str) -> None:
+        with self.con:
+            self.con.execute(
+                "insert into watermark (name, value) values (?, ?) "
+                "on conflict (name) do update set value = excluded.value",
+                (name, value),
+            )
+
+    def get_watermark(self, name: str) -> datetime | None:
+        value = self.get_value(name)
+        return datetime.fromisoformat(value) if value else None
+
+    def set_watermark(self, name: str, value: datetime) -> None:
+        self.set_value(name, value.isoformat())
+
+    def is_processed(self, pairs: Iterable[tuple[str, int]]) -> set[tuple[str, int]]:
+        """
+        Return the pairs of ``pairs`` already processed.
+        """
+        found = set()
+
+        for chunk in batched(pairs, 400):
+            values = ",".join("(?, ?)" for __ in chunk)
+            params = [value for pair in chunk for value in pair]
+            found.update(
+                self.con.execute(
+                    f"with src(chave, status) as (values {values}) "
+                    "select p.chave, p.status from processed p "
+                    "join src s on s.chave = p.chave and s.status = p.status",
+                    params,
+                )
+            )
+
+        return found
+
+    def mark_processed(self, pairs: Iterable[tuple[str, int]]) -> None:
+        with self.con:
+            self.con.executemany(
+                "insert or ignore into processed (chave, status) values (?, ?)",
+                pairs,
+            )
+
+    def close(self) -> None:
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -1,10 +1,24 @@
-from deltalake import DeltaTable, write_deltalake
+from deltalake import ColumnProperties, DeltaTable, WriterProperties, write_deltalake
+from deltalake.exceptions import CommitFailedError, DeltaError
 from xml_aws_athena import config
+from xml_aws_athena.schema import (
+    dictionary_columns,
+    partition_by,
+    schema_nota,
+    schema_silver,
+)
 import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.fs as pafs
 import duckdb
 import os
+import random
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-from time import sleep
+from functools import cache
+from time import perf_counter, sleep
+from typing import Any, Callable, Generator, Literal, TypeVar
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,6 +28,7 @@ region_name = config.get("region_name")
 aws_access_key_id = config.get("aws_access_key_id")
 aws_secret_access_key = config.get("aws_secret_access_key")
 table_path = f"s3://{config.get('bucket_xml')}/silver/notas/"
+keys_path = f"s3://{config.get('bucket_xml')}/silver/_keys/notas"
 
 storage_options = {
     "AWS_REGION": region_name,
@@ -21,98 +36,672 @@ storage_options = {
     "AWS_SECRET_ACCESS_KEY": aws_secret_access_key,
 }
 
+# S3 has no atomic rename: concurrent writers need a DynamoDB lock table
+if config.get("delta_locking_provider") == "dynamodb":
+    storage_options |= {
+        "AWS_S3_LOCKING_PROVIDER": "dynamodb",
+        "DELTA_DYNAMO_TABLE_NAME": config.get("delta_dynamo_table", "delta_log"),
+    }
 
-def is_delta_table(path: str = table_path) -> bool:
+
+@contextmanager
+def use_table(
+    path: str, keys: str = None, options: dict[str, str] = None
+) -> Generator[str, Any, None]:
+    """
+    Point the silver helpers at another Delta table, e.g. a local directory,
+    and back at the configured one on exit.
+    Args:
+        path (str): Path of the Delta table.
+        keys (str, optional): Directory of the key index. Defaults to
+            ``_keys/notas`` next to the table.
+        options (dict[str, str], optional): Storage options. Defaults to
+            None, none, as for a local path.
+    """
+    global table_path, keys_path, storage_options
+
+    previous = table_path, keys_path, storage_options
+    table_path = path
+    keys_path = keys or f"{path.rstrip('/').rsplit('/', 1)[0]}/_keys/notas"
+    storage_options = options or {}
+
+    try:
+        yield table_path
+    finally:
+        table_path, keys_path, storage_options = previous
+
+
+# Parquet files of the silver table, repetitive columns as dictionary pages
+WRITER_PROPERTIES = WriterProperties(
+    compression=config.get("delta_compression", "ZSTD"),
+    compression_level=int(config.get("delta_compression_level", 3)),
+    column_properties={
+        name: ColumnProperties(dictionary_enabled=True) for name in dictionary_columns
+    },
+)
+
+# retries of a commit that lost a race with another writer
+MAX_RETRIES = int(config.get("delta_max_retries", 8))
+BASE_DELAY = float(config.get("delta_base_delay", 0.5))
+MAX_DELAY = float(config.get("delta_max_delay", 30.0))
+
+# files replaced by a commit are kept this long for readers and time travel
+VACUUM_RETENTION_HOURS = int(config.get("delta_vacuum_retention_hours", 168))
+
+# changes of the silver table, read by the incremental gold load
+CDF_PROPERTY = "delta.enableChangeDataFeed"
+CHANGE_DATA_FEED = {CDF_PROPERTY: "true"}
+
+# reads of the silver table
+READ_BATCH_SIZE = int(config.get("silver_read_batch_size", 100_000))
+DUCKDB_MEMORY_LIMIT = config.get("duckdb_memory_limit", "2GB")
+
+T = TypeVar("T")
+Failure = Literal["conflict", "transient", "fatal"]
+
+# rows to write: a table, or a callable opening a new reader on each call
+Rows = pa.Table | Callable[[], pa.RecordBatchReader]
+
+# commits of the Delta log that leave the rows of the table unchanged
+MAINTENANCE_OPERATIONS = frozenset(
+    {"OPTIMIZE", "VACUUM START", "VACUUM END", "SET TBLPROPERTIES"}
+)
+
+TRANSIENT_MESSAGES = ("timeout", "timed out", "connection", "slow down", "throttl")
+
+
+class CommitMetrics:
+    """Commits, retries by kind and time spent writing the Delta table."""
+
+    def __init__(self) -> None:
+        self.commits = 0
+        self.conflicts = 0
+        self.transients = 0
+        self.failures = 0
+        self.elapsed = 0.0
+        self.waited = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, **kwargs) -> None:
+        with self.lock:
+            for name, value in kwargs.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def __repr__(self) -> str:
+        return (
+            f"CommitMetrics(commits={self.commits}, conflicts={self.conflicts}, "
+            f"transients={self.transients}, failures={self.failures}, "
+            f"elapsed={self.elapsed:.2f}s, waited={self.waited:.2f}s)"
+        )
+
+
+commit_metrics = CommitMetrics()
+
+
+def classify_error(error: Exception) -> Failure:
+    """
+    Classify a failed commit: a conflict with a concurrent transaction was
+    not committed and can be retried, a transient storage error may have
+    been committed, anything else is fatal.
+    """
+    message = str(error).lower()
+
+    if isinstance(error, CommitFailedError):
+        return "conflict"
+
+    if isinstance(error, (OSError, DeltaError)) and any(
+        m in message for m in TRANSIENT_MESSAGES
+    ):
+        return "transient"
+
+    return "fatal"
+
+
+def commit_with_retry(
+    operation: Callable[[], T],
+    name: str,
+    max_retries: int = MAX_RETRIES,
+    idempotent: bool = False,
+    classify: Callable[[Exception], Failure] = classify_error,
+) -> T:
+    """
+    Run a Delta commit, retrying conflicts with exponential backoff and
+    full jitter.
+    Args:
+        operation (Callable[[], T]): Loads the table and commits. Called
+            again on every attempt, so it must not reuse a stale ``DeltaTable``.
+        name (str): Name of the operation, for logging.
+        max_retries (int, optional): Retries before giving up. Defaults to MAX_RETRIES.
+        idempotent (bool, optional): Also retry transient errors, whose commit
+            may have gone through. Only safe when running ``operation`` twice
+            gives the same table, e.g. a merge, not an append. Defaults to False.
+        classify (Callable, optional): Classifies the errors of ``operation``.
+            Defaults to ``classify_error``, for Delta commits.
+    Returns:
+        T: Result of ``operation``.
+    """
+    for attempt in range(max_retries + 1):
+        start = perf_counter()
+
+        try:
+            rst = operation()
+        except Exception as e:
+            commit_metrics.add(elapsed=perf_counter() - start)
+            failure = classify(e)
+
+            retry = failure == "conflict" or (failure == "transient" and idempotent)
+
+            if not retry or attempt == max_retries:
+                commit_metrics.add(failures=1)
+                raise
+
+            delay = random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2**attempt))
+            commit_metrics.add(
+                conflicts=failure == "conflict",
+                transients=failure == "transient",
+                waited=delay,
+            )
+            logger.info(
+                f"Erro ({failure}) no {name}, tentativa {attempt + 1} de "
+                f"{max_retries}, aguardando {delay:.2f}s: {e}"
+            )
+            sleep(delay)
+        else:
+            commit_metrics.add(commits=1, elapsed=perf_counter() - start)
+            return rst
+
+
+def filesystem(path: str) -> tuple[pafs.FileSystem, str]:
+    """
+    Filesystem and path of ``path``, local or ``s3://`` with the table credentials.
+    """
+    if path.startswith("s3://"):
+        fs = pafs.S3FileSystem(
+            access_key=aws_access_key_id,
+            secret_key=aws_secret_access_key,
+            region=region_name,
+        )
+        return fs, path.removeprefix("s3://")
+
+    return pafs.LocalFileSystem(), path
+
+
+def is_delta_table(path: str = None) -> bool:
+    """
+    Check if the path is a Delta Lake table, by default ``table_path``.
+    """
+    return DeltaTable.is_deltatable(path or table_path, storage_options=storage_options)
+
+
+def with_partitions(data: pa.Table) -> pa.Table:
+    """
+    Add the ``year``/``month`` partition columns, derived from ``dh_emi``.
+    """
+    if "year" in data.column_names:
+        return data
+
+    dh_emi = data["dh_emi"]
+
+    return data.append_column("year", pc.year(dh_emi).cast(pa.int16())).append_column(
+        "month", pc.month(dh_emi).cast(pa.int8())
+    )
+
+
+def decode_dictionaries(data: pa.Table) -> pa.Table:
+    """
+    Decode dictionary columns to their values, Delta Lake has no dictionary
+    type. Parquet keeps them dictionary encoded through ``WRITER_PROPERTIES``.
+    """
+    schema = pa.schema(
+        [
+            field.with_type(field.type.value_type)
+            if pa.types.is_dictionary(field.type)
+            else field
+            for field in data.schema
+        ]
+    )
+
+    return data.cast(schema)
+
+
+def partition_predicate(data: pa.Table, alias: str = "t") -> str:
+    """
+    Bounds of the partitions touched by ``data``, as a merge predicate on
+    the target, so the merge only scans and rewrites those partitions.
+    Args:
+        data (pa.Table): Source rows, with the partition columns.
+        alias (str, optional): Alias of the target table. Defaults to "t".
+    Returns:
+        str: Predicate like ``t.controle in ('TRANSF') and t.year in (2025) ...``.
+    """
+    bounds = []
+
+    for name in partition_by:
+        values = pc.unique(data[name]).to_pylist()
+        literals = [
+            "'{}'".format(value.replace("'", "''"))
+            if isinstance(value, str)
+            else str(value)
+            for value in values
+            if value is not None
+        ]
+
+        terms = [f"{alias}.{name} in ({', '.join(literals)})"] if literals else []
+        if None in values:
+            terms.append(f"{alias}.{name} is null")
+
+        bounds.append(terms[0] if len(terms) == 1 else f"({' or '.join(terms)})")
+
+    return " and ".join(bounds)
+
+
+def silver_rows(
+    data: Rows, partitioned: bool = True, schema: pa.Schema = schema_silver
+) -> pa.Table | pa.RecordBatchReader:
     """
-    Check if the path is a Delta Lake table.
+    Rows of ``data`` as written to the Delta table, with the partition
+    columns when it is partitioned and the dictionaries decoded. A reader
+    factory is opened and converted batch by batch, never read whole.
+    Args:
+        data (Rows): Table, or callable opening a new reader on each call.
+        partitioned (bool, optional): The table is partitioned by
+            ``partition_by``. Defaults to True.
+        schema (pa.Schema, optional): Columns of the partitioned table.
+            Defaults to schema_silver.
+    Returns:
+        pa.Table | pa.RecordBatchReader: Rows to write.
     """
-    return DeltaTable.is_deltatable(path, storage_options=storage_options)
 
+    def convert(rows: pa.Table | pa.RecordBatch) -> pa.Table | pa.RecordBatch:
+        if partitioned:
+            rows = with_partitions(rows).select(schema.names)
+        return decode_dictionaries(rows)
+
+    if isinstance(data, pa.Table):
+        return convert(data)
 
-def write_deltalake_aws(data: pa.Table, schema: pa.Schema) -> None:
+    reader = data()
+    return pa.RecordBatchReader.from_batches(
+        convert(reader.schema.empty_table()).schema, map(convert, reader)
+    )
+
+
+def partition_values(data: Rows) -> pa.Table:
     """
-    Write a Delta Lake table.
+    Distinct ``partition_by`` values of ``data``, batch by batch for a
+    reader factory.
     """
-    # Create a new Delta Lake table
-    write_deltalake(
-        table_path,
-        data,
-        schema=schema,
-        mode="overwrite",
-        storage_options=storage_options,
+    tables = (
+        [data]
+        if isinstance(data, pa.Table)
+        else (pa.Table.from_batches([batch]) for batch in data())
+    )
+
+    return pa.concat_tables(
+        [
+            decode_dictionaries(with_partitions(table).select(partition_by))
+            .group_by(partition_by)
+            .aggregate([])
+            for table in tables
+        ]
     )
 
 
-def merge_deltalake_aws(data: pa.Table) -> None:
+def write_deltalake_aws(data: Rows, schema: pa.Schema = schema_silver) -> bool:
     """
-    Merge a Delta Lake table.
+    Create the Delta Lake table, partitioned by ``partition_by``.
+
+    It is never retried nor overwritten: when another writer created the
+    table first, nothing is written and the rows must be appended or merged.
+    Args:
+        data (Rows): Table, or callable opening a reader of the rows.
+        schema (pa.Schema, optional): Schema of the table. Defaults to schema_silver.
+    Returns:
+        bool: True when this call created the table.
     """
     try:
+        write_deltalake(
+            table_path,
+            silver_rows(data, schema=schema),
+            schema=schema,
+            mode="error",
+            partition_by=partition_by,
+            configuration=CHANGE_DATA_FEED,
+            writer_properties=WRITER_PROPERTIES,
+            storage_options=storage_options,
+        )
+    except DeltaError:
+        if not is_delta_table():
+            raise
+
+        logger.info("Tabela Delta Lake criada por outro processo")
+        return False
+
+    commit_metrics.add(commits=1)
+    return True
+
+
+def enable_change_data_feed() -> bool:
+    """
+    Enable the change data feed of a table created without it.
+    Returns:
+        bool: True when the property was changed.
+    """
+    dt = DeltaTable(table_path, storage_options=storage_options)
+    if dt.metadata().configuration.get(CDF_PROPERTY) == "true":
+        return False
+
+    commit_with_retry(
+        lambda: DeltaTable(
+            table_path, storage_options=storage_options
+        ).alter.set_table_properties(CHANGE_DATA_FEED),
+        "cdf",
+        idempotent=True,
+    )
+    return True
+
+
+def table_version() -> int:
+    """Current version of the Delta Lake table."""
+    return DeltaTable(table_path, storage_options=storage_options).version()
+
+
+def data_version() -> int:
+    """
+    Version of the last commit that changed the rows of the Delta Lake
+    table, skipping the ``MAINTENANCE_OPERATIONS`` commits after it.
+    """
+    dt = DeltaTable(table_path, storage_options=storage_options)
+    limit = 8
+
+    while True:
+        history = dt.history(limit)
+
+        for commit in history:
+            if commit.get("operation") not in MAINTENANCE_OPERATIONS:
+                return commit["version"]
+
+        if len(history) < limit:
+            return dt.version()
+
+        limit *= 4
+
+
+def data_commits(since: int) -> list[int]:
+    """
+    Versions, newest first, of the commits after ``since`` that changed the
+    rows of the Delta Lake table.
+    """
+    dt = DeltaTable(table_path, storage_options=storage_options)
+
+    return [
+        commit["version"]
+        for commit in dt.history(max(1, dt.version() - since))
+        if commit["version"] > since
+        and commit.get("operation") not in MAINTENANCE_OPERATIONS
+    ]
+
+
+def version_timestamp(version: int) -> datetime | None:
+    """Commit time of ``version``, None when it is no longer in the log."""
+    dt = DeltaTable(table_path, storage_options=storage_options)
+
+    for commit in dt.history(max(1, dt.version() - version + 1)):
+        if commit.get("version") == version:
+            return datetime.fromtimestamp(commit["timestamp"] / 1000)
+
+    return None
+
+
+def read_keys() -> pa.Table:
+    """
+    ``chave`` and ``item`` columns of the Delta Lake table, with the
+    ``controle`` and ``dh_emi`` columns its partitions derive from.
+    """
+    dt = DeltaTable(table_path, storage_options=storage_options)
+    return dt.to_pyarrow_dataset().to_table(
+        columns=["chave", "item", "controle", "dh_emi"]
+    )
+
+
+def append_deltalake_aws(data: Rows) -> None:
+    """
+    Append to a Delta Lake table, partitioned by ``partition_by``.
+    Tables created before the partitioning are appended as they are.
+    A reader factory is opened again on every attempt.
+    """
+
+    def append() -> None:
         dt = DeltaTable(table_path, storage_options=storage_options)
-        rst = (
+        partitioned = dt.metadata().partition_columns == partition_by
+
+        write_deltalake(
+            dt,
+            silver_rows(data, partitioned),
+            mode="append",
+            writer_properties=WRITER_PROPERTIES,
+            storage_options=storage_options,
+        )
+
+    commit_with_retry(append, "append")
+
+
+def merge_deltalake_aws(data: Rows) -> dict:
+    """
+    Merge a Delta Lake table, pruned to the partitions of ``data``.
+    Tables created before the partitioning are merged as a whole.
+    A reader factory is opened again on every attempt.
+    """
+
+    def merge() -> dict:
+        dt = DeltaTable(table_path, storage_options=storage_options)
+        partitioned = dt.metadata().partition_columns == partition_by
+
+        predicate = "s.chave = t.chave and s.item = t.item"
+        if partitioned:
+            predicate = f"{predicate} and {partition_predicate(partition_values(data))}"
+        else:
+            logger.warning("Tabela Delta Lake sem partições, merge sem poda")
+
+        return (
             dt.merge(
-                data,
-                predicate="s.chave = t.chave and s.item = t.item",
+                silver_rows(data, partitioned),
+                predicate=predicate,
                 source_alias="s",
                 target_alias="t",
+                writer_properties=WRITER_PROPERTIES,
             )
             .when_not_matched_insert_all()
             .when_matched_update_all()
             .execute()
         )
-    except Exception:
-        logger.info("Erro ao fazer merge, tentando novamente em 5 segundos ...")
-        sleep(5.0)
-        merge_deltalake_aws(data)
 
-    return rst
+    return commit_with_retry(merge, "merge", idempotent=True)
 
 
 def delta_optimize_aws() -> list[str]:
     """Optimize Delta Lake table."""
-    dt = DeltaTable(table_path, storage_options=storage_options)
-    dt.optimize.compact()
 
-    rst = dt.vacuum(retention_hours=0, enforce_retention_duration=False, dry_run=False)
+    def compact() -> dict:
+        dt = DeltaTable(table_path, storage_options=storage_options)
+        return dt.optimize.compact(writer_properties=WRITER_PROPERTIES)
+
+    commit_with_retry(compact, "optimize", idempotent=True)
+
+    dt = DeltaTable(table_path, storage_options=storage_options)
+    rst = dt.vacuum(
+        retention_hours=VACUUM_RETENTION_HOURS,
+        enforce_retention_duration=False,
+        dry_run=False,
+    )
     dt.create_checkpoint()
     dt.cleanup_metadata()
 
     return rst
 
 
-def read_deltalake_aws(start: datetime, end: datetime) -> pa.Table:
+@cache
+def duckdb_connection() -> duckdb.DuckDBPyConnection:
     """
-    Read a Delta Lake table.
+    In-memory DuckDB connection with the ``delta``/``httpfs`` extensions and
+    the S3 secret, configured once and reused by every read.
     """
+    con = duckdb.connect(
+        config={
+            "threads": os.cpu_count() * 5,
+            "memory_limit": DUCKDB_MEMORY_LIMIT,
+            "preserve_insertion_order": False,
+        }
+    )
 
-    with duckdb.connect(
-        database="delta.duckdb", config={"threads": os.cpu_count() * 5}
-    ) as con:
-        for ext in ["delta", "httpfs"]:
-            con.install_extension(ext)
-            con.load_extension(ext)
+    for ext in ["delta", "httpfs"]:
+        con.install_extension(ext)
+        con.load_extension(ext)
 
-        # credentials
-        con.sql(
-            f"""
-            CREATE SECRET IF NOT EXISTS (
-                TYPE s3,
-                KEY_ID '{aws_access_key_id}',
-                SECRET '{aws_secret_access_key}',
-                REGION '{region_name}'
-            )
-            """
+    # credentials
+    con.sql(
+        f"""
+        CREATE SECRET IF NOT EXISTS (
+            TYPE s3,
+            KEY_ID '{aws_access_key_id}',
+            SECRET '{aws_secret_access_key}',
+            REGION '{region_name}'
         )
+        """
+    )
+
+    return con
+
+
+def read_filters(
+    start: datetime, end: datetime, controles: list[str] = None
+) -> list[str]:
+    """
+    Filters of a read, with the partition bounds of the window when the
+    table is partitioned. ``dh_emi`` also prunes files by their statistics.
+    ``controles`` are normalized as the parser stores them, trimmed and in
+    lower case.
+    """
+    filters = [
+        f"dh_emi between '{start:%Y-%m-%d} 00:00:00.000' "
+        f"and '{end:%Y-%m-%d} 23:59:59.999'"
+    ]
+
+    if controles:
+        values = ", ".join(
+            "'{}'".format(c.strip().lower().replace("'", "''")) for c in controles
+        )
+        filters.append(f"controle in ({values})")
+
+    dt = DeltaTable(table_path, storage_options=storage_options)
+    if dt.metadata().partition_columns != partition_by:
+        return filters
+
+    filters.append(f'"year" between {start.year} and {end.year}')
+    if start.year == end.year:
+        filters.append(f'"month" between {start.month} and {end.month}')
+
+    return filters
+
+
+# columns handed to gold, in the order of schema_nota
+GOLD_COLUMNS = ", ".join(
+    [
+        *(f'"{name}"' for name in schema_nota.names),
+        'year(dh_emi) as "year"',
+        'month(dh_emi) as "month"',
+    ]
+)
+
+
+def read_changes(
+    starting_version: int,
+    ending_version: int,
+    batch_size: int = READ_BATCH_SIZE,
+) -> pa.RecordBatchReader:
+    """
+    Rows inserted or updated between two versions, from the change data feed.
+    Args:
+        starting_version (int): First version, inclusive.
+        ending_version (int): Last version, inclusive.
+        batch_size (int, optional): Rows per batch. Defaults to READ_BATCH_SIZE.
+    Returns:
+        pa.RecordBatchReader: Latest image of each changed ``chave``/``item``,
+            with the columns of ``read_deltalake_aws``.
+    """
+    dt = DeltaTable(table_path, storage_options=storage_options)
+    changes = dt.load_cdf(
+        starting_version=starting_version, ending_version=ending_version
+    )
+
+    return query_reader(
+        f"""
+            select distinct on (chave, item) {GOLD_COLUMNS}
+            from changes
+            where _change_type in ('insert', 'update_postimage')
+            order by chave, item, _commit_version desc
+        """,
+        batch_size,
+        changes=changes,
+    )
+
+
+def read_snapshot(batch_size: int = READ_BATCH_SIZE) -> pa.RecordBatchReader:
+    """
+    Every row of the current version, with the columns of ``read_deltalake_aws``.
+    """
+    dt = DeltaTable(table_path, storage_options=storage_options)
+    snapshot = dt.to_pyarrow_dataset()
+
+    return query_reader(
+        f"select distinct on (chave, item) {GOLD_COLUMNS} from snapshot",
+        batch_size,
+        snapshot=snapshot,
+    )
 
-        arrow = con.sql(
-            f"""
-                select distinct on (chave, item)
-                    *,
-                    year(dh_emi) as "year", 
-                    month(dh_emi) as "month"
-                from delta_scan({table_path!r})
-                where dh_emi between '{start:%Y-%m-%d} 00:00:00.000' and '{end:%Y-%m-%d} 23:59:59.999'
-                """
-        ).arrow()
-
-    return arrow
+
+def query_reader(query: str, batch_size: int, **views) -> pa.RecordBatchReader:
+    """
+    Run ``query`` on a cursor of the shared connection, with ``views``
+    registered, and stream the result; the cursor closes with the stream.
+    """
+    cursor = duckdb_connection().cursor()
+    for name, view in views.items():
+        cursor.register(name, view)
+
+    reader = cursor.sql(query).fetch_record_batch(batch_size)
+
+    def batches() -> Generator[pa.RecordBatch, Any, None]:
+        try:
+            yield from reader
+        finally:
+            cursor.close()
+
+    return pa.RecordBatchReader.from_batches(reader.schema, batches())
+
+
+def read_deltalake_aws(
+    start: datetime,
+    end: datetime,
+    batch_size: int = READ_BATCH_SIZE,
+    controles: list[str] = None,
+) -> pa.RecordBatchReader:
+    """
+    Read a Delta Lake table, as a stream of record batches.
+    Args:
+        start (datetime): Start date of ``dh_emi``.
+        end (datetime): End date of ``dh_emi``.
+        batch_size (int, optional): Rows per batch. Defaults to READ_BATCH_SIZE.
+        controles (list[str], optional): Read only these ``controle`` partitions.
+            Defaults to None, all of them.
+    Returns:
+        pa.RecordBatchReader: One row per ``chave``/``item``.
+    """
+    return query_reader(
+        f"""
+            select distinct on (chave, item) {GOLD_COLUMNS}
+            from delta_scan({table_path!r})
+            where {" and ".join(read_filters(start, end, controles))}
+            """,
+        batch_size,
+    )
@@ -0,0 +1,28 @@
+import pytest
+from deltalake import DeltaTable
+import xml_aws_athena.write as Write
+
+
+@pytest.fixture
+def local_delta(tmp_path):
+    """Silver Delta table and key index in a temporary local directory."""
+    with Write.use_table(str(tmp_path / "silver" / "notas")):
+        yield tmp_path
+
+
+@pytest.fixture
+def local_silver(local_delta, monkeypatch):
+    """
+    ``local_delta`` with the state store in it, read back without the DuckDB
+    delta extension, downloaded on use.
+    """
+    monkeypatch.chdir(local_delta)
+    monkeypatch.setattr(
+        Write,
+        "read_deltalake_aws",
+        lambda start, end, **kwargs: (
+            DeltaTable(Write.table_path).to_pyarrow_dataset().scanner().to_reader()
+        ),
+    )
+
+    yield local_delta
@@ -1,3 +1,5 @@
+import pytest
+from io import BytesIO
 from xml_aws_athena.cloud import Storage
 
 s3 = Storage()
@@ -35,3 +37,49 @@ def test_delete_bucket():
 
     # Assert that the function returns True
     assert result is True
+
+
+def test_put_objects():
+    moto = pytest.importorskip("moto")
+
+    with moto.mock_aws():
+        client = Storage(
+            max_pool_connections=4,
+            multipart_threshold=5 * 2**20,
+            region_name="sa-east-1",
+        )
+        client.create_bucket("teste-mvsh999")
+
+        # Small bodies go as put_object, the large one as a multipart upload
+        objects = [(f"file {p}", f"test_{p}.txt") for p in range(20)]
+        objects.append((BytesIO(b"x" * 6 * 2**20), "large.bin", "identity"))
+        result = client.put_objects(iter(objects), "teste-mvsh999", workers=8)
+
+        # Assert that every object was uploaded and measured
+        assert result == [True] * 21
+        assert client.metrics.calls == 21 and client.metrics.errors == 0
+        assert (
+            client.metrics.bytes == sum(len(f"file {p}") for p in range(20)) + 6 * 2**20
+        )
+        assert client.get_object_file("teste-mvsh999", "test_7.txt") == b"file 7"
+        assert len(client.list_objects("teste-mvsh999")) == 21
+
+
+def test_put_object_multipart_failure(monkeypatch):
+    moto = pytest.importorskip("moto")
+    from boto3.exceptions import S3UploadFailedError
+
+    with moto.mock_aws():
+        client = Storage(multipart_threshold=5 * 2**20, region_name="sa-east-1")
+        client.create_bucket("teste-mvsh999")
+
+        def upload_fileobj(*args, **kwargs):
+            raise S3UploadFailedError("Failed to upload large.bin")
+
+        monkeypatch.setattr(client.s3_client, "upload_fileobj", upload_fileobj)
+        body = "x" * 6 * 2**20
+
+        # Assert that a failed multipart upload is reported and measured
+        assert client.put_object_file(body, "teste-mvsh999", "large.bin") is False
+        assert client.metrics.errors == 1
+        assert client.metrics.bytes == 6 * 2**20
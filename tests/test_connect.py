@@ -1,5 +1,9 @@
-from xml_aws_athena.connect import iter_notes
-from datetime import datetime
+import pytest
+import re
+from xml_aws_athena import connect
+from xml_aws_athena.connect import iter_notes, iter_note_batches, FetchMetrics
+from xml_aws_athena.connect import ConnectionPool, fetch_batches, split_window
+from datetime import datetime, timedelta
 from itertools import islice
 from pyodbc import Row
 from xml_aws_athena import config
@@ -25,3 +29,140 @@ def test_iter_notes():
     for row in result:
         assert isinstance(row, Row), f"Esperava uma Row, mas recebeu {type(row)}"
         assert len(row) == 5
+
+
+def test_iter_note_batches():
+    # Define test parameters
+    server = config.get("server_test")
+    database = config.get("database_test")
+    tips = ["INCINERACAO", "ESTORNO-INCINERACAO"]
+    start = datetime(2025, 4, 1)
+    end = datetime(2025, 4, 2)
+    metrics = FetchMetrics()
+
+    # Call the function with a small batch size
+    result = list(
+        islice(
+            iter_note_batches(
+                server,
+                database,
+                tips=tips,
+                start=start,
+                end=end,
+                batch_rows=5,
+                metrics=metrics,
+            ),
+            2,
+        )
+    )
+
+    # Assert that the batches respect the row count and were measured
+    for batch in result:
+        assert 0 < len(batch) <= 5
+    assert metrics.rows == sum(len(batch) for batch in result)
+
+
+def test_split_window():
+    # Assert that the days are inclusive and split into half-open days
+    days = split_window(datetime(2025, 4, 1, 15), datetime(2025, 4, 3))
+    assert days == [
+        (datetime(2025, 4, 1), datetime(2025, 4, 2)),
+        (datetime(2025, 4, 2), datetime(2025, 4, 3)),
+        (datetime(2025, 4, 3), datetime(2025, 4, 4)),
+    ]
+
+    # Assert that the hours cover the whole day without gaps
+    hours = split_window(datetime(2025, 4, 1), datetime(2025, 4, 1), by="hour")
+    assert len(hours) == 24
+    assert hours[0] == (datetime(2025, 4, 1), datetime(2025, 4, 1, 1))
+    assert all(a[1] == b[0] for a, b in zip(hours, hours[1:]))
+    assert hours[-1][1] == datetime(2025, 4, 2)
+
+
+class FakeCursor:
+    def __init__(self, con) -> None:
+        self.con = con
+        self.batches = []
+
+    def execute(self, query: str) -> None:
+        if self.con.fail:
+            raise RuntimeError("query failed")
+
+        # three batches of two rows tagged with the start of the shard
+        lower = re.search(r">= '([^']+)'", query).group(1)
+        self.batches = [[(lower, b)] * 2 for b in range(3)]
+
+    def fetchmany(self, size: int) -> list:
+        return self.batches.pop(0) if self.batches else []
+
+    def close(self) -> None:
+        pass
+
+
+class FakeConnection:
+    def __init__(self, fail: bool = False) -> None:
+        self.fail = fail
+        self.closed = False
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self)
+
+    def commit(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_pool_discards_failed_connection(monkeypatch):
+    opened = []
+
+    def open_connection(*args, **kwargs):
+        opened.append(FakeConnection(fail=not opened))
+        return opened[-1]
+
+    monkeypatch.setattr(connect, "open_connection", open_connection)
+
+    with ConnectionPool("fake", size=1) as pool:
+        with pytest.raises(RuntimeError):
+            with pool.cursor() as cursor:
+                cursor.execute("select 1")
+
+        # Assert that the failed connection is closed and replaced
+        with pool.cursor() as cursor:
+            cursor.execute("where dthGravacao >= '2025-04-01 00:00:00'")
+
+    assert opened[0].closed and len(opened) == 2
+
+
+def test_iter_notes_sharded(monkeypatch):
+    monkeypatch.setattr(connect, "open_connection", lambda *a, **k: FakeConnection())
+    start, end = datetime(2025, 4, 1), datetime(2025, 4, 6)
+
+    rows = list(
+        connect.iter_notes_sharded(
+            "s", "db", tips=["T"], start=start, end=end, workers=2, batch_rows=2
+        )
+    )
+
+    # Assert that the shards are merged in order, batch by batch
+    days = [f"{start + timedelta(days=d):%Y-%m-%d %H:%M:%S}" for d in range(6)]
+    assert [row[0] for row in rows] == [day for day in days for __ in range(6)]
+
+    # Assert that stopping early releases the shards still running
+    notes = connect.iter_notes_sharded(
+        "s", "db", tips=["T"], start=start, end=end, workers=2
+    )
+    assert len(list(islice(notes, 3))) == 3
+    notes.close()
+
+
+def test_fetch_batches_chars():
+    cursor = FakeCursor(FakeConnection())
+    cursor.batches = [[("ção" * 2, n)] * 3 for n in range(2)]
+    metrics = FetchMetrics()
+
+    # Assert that batch_chars regroups the round trips by characters
+    batches = list(fetch_batches(cursor, 3, batch_chars=10, metrics=metrics))
+    assert [len(batch) for batch in batches] == [2, 2, 2]
+    assert metrics.rows == 6 and metrics.chars == 36 and metrics.fetches == 3
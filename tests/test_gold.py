@@ -0,0 +1,45 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+from xml_aws_athena.gold import classify_error, partition_bounds, stage_parquet
+
+
+def test_stage_parquet_partitions(tmp_path):
+    months = [(2025, 4), (2025, 3), (2025, 4), (2024, 12), (2025, 4), (2025, 3)]
+    table = pa.table(
+        {
+            "chave": [f"{n:044d}" for n in range(len(months))],
+            "item": [1] * len(months),
+            "year": [year for year, __ in months],
+            "month": [month for __, month in months],
+        }
+    )
+
+    # Two batches, so the partitions span batches and roll over to new files
+    reader = pa.RecordBatchReader.from_batches(table.schema, table.to_batches(3))
+    files, rows = stage_parquet(reader, str(tmp_path), rows_per_file=2)
+
+    # Assert that each (year, month) gets its own files, with only its rows
+    assert rows == len(months)
+    assert sorted(files) == [(2024, 12), (2025, 3), (2025, 4)]
+    assert len(files[(2025, 4)]) == 2
+
+    for (year, month), paths in files.items():
+        staged = pa.concat_tables(pq.read_table(path) for path in paths)
+        assert set(staged.column("year").to_pylist()) == {year}
+        assert set(staged.column("month").to_pylist()) == {month}
+        assert staged.num_rows == months.count((year, month))
+
+
+def test_partition_bounds():
+    # Assert that null partitions are matched with is null
+    assert partition_bounds((2025, 4)) == "t.year = 2025 and t.month = 4"
+    assert partition_bounds((None, None), "s") == "s.year is null and s.month is null"
+
+
+def test_classify_error():
+    # Assert that Athena Iceberg errors are classified apart from Delta ones
+    assert classify_error(Exception("ICEBERG_COMMIT_ERROR: failed")) == "conflict"
+    assert classify_error(Exception("ThrottlingException: Rate exceeded")) == (
+        "transient"
+    )
+    assert classify_error(Exception("COLUMN_NOT_FOUND: line 1:8")) == "fatal"
@@ -0,0 +1,79 @@
+from benchmarks.generator import generate_rows
+from deltalake import DeltaTable
+from xml_aws_athena import silver
+from xml_aws_athena.builder import SpillBuffer
+from xml_aws_athena.keys import KeyIndex, shard_column
+from xml_aws_athena.schema import schema_compact
+import xml_aws_athena.write as Write
+
+
+def write(rows: list[tuple], index: KeyIndex) -> None:
+    table = silver.read_parquet_temp([*enumerate(rows)], compact=True)
+
+    with SpillBuffer(schema_compact) as buffer:
+        for batch in table.to_batches():
+            buffer.write(batch)
+
+        silver.write_silver(buffer, len(rows), index)
+
+
+def test_index_skips_maintenance(local_delta, monkeypatch):
+    rows = list(generate_rows(6, items=2))
+    index = KeyIndex()
+    write(rows[:2], index)
+    write(rows[2:4], index)
+
+    rebuilds = []
+    read_keys = Write.read_keys
+    monkeypatch.setattr(Write, "read_keys", lambda: rebuilds.append(1) or read_keys())
+
+    # compaction, vacuum and property commits leave the keys unchanged
+    DeltaTable(Write.table_path).optimize.compact()
+    DeltaTable(Write.table_path).vacuum(
+        retention_hours=0, enforce_retention_duration=False, dry_run=False
+    )
+    DeltaTable(Write.table_path).alter.set_table_properties(
+        {"delta.enableChangeDataFeed": "true"}
+    )
+
+    # Assert that neither this writer nor a new index rebuilds the keys
+    write(rows[4:5], index)
+    news, existing = KeyIndex().split(silver.read_parquet_temp([*enumerate(rows)]))
+    assert (news.num_rows, existing.num_rows) == (2, 10)
+    assert rebuilds == []
+
+    # Assert that a write outside the index still forces a rebuild
+    Write.append_deltalake_aws(silver.read_parquet_temp([*enumerate(rows[5:])]))
+    news, existing = KeyIndex().split(silver.read_parquet_temp([*enumerate(rows)]))
+    assert (news.num_rows, existing.num_rows) == (0, 12)
+    assert rebuilds == [1]
+
+
+def test_index_shards(local_delta):
+    # notes from April to June, one shard per controle/year/month
+    rows = list(generate_rows(12, items=2, days=90))
+    index = KeyIndex()
+    write(rows[:9], index)
+
+    files = {path: path.stat().st_mtime_ns for path in local_delta.rglob("*.parquet")}
+    files = {path: stamp for path, stamp in files.items() if "_keys" in path.parts}
+    assert len(files) > 1
+
+    june = silver.read_parquet_temp([*enumerate(rows[9:])])
+    touched = set(shard_column(june).to_pylist())
+    assert all("month=6" in shard for shard in touched)
+    write(rows[9:], index)
+
+    # Assert that a batch only loads and rewrites the shards it touches
+    changed = {
+        path.relative_to(index.path).with_suffix("").as_posix()
+        for path, stamp in files.items()
+        if path.stat().st_mtime_ns != stamp
+    }
+    assert changed <= touched
+    assert set(index.shards) == touched
+    assert len(index) == june.num_rows
+
+    # Assert that a new index finds every key in the shards
+    news, existing = KeyIndex().split(silver.read_parquet_temp([*enumerate(rows)]))
+    assert (news.num_rows, existing.num_rows) == (0, 24)
@@ -0,0 +1,156 @@
+import pyarrow as pa
+import pytest
+from datetime import datetime, timedelta
+from deltalake import write_deltalake
+from xml_aws_athena import gold, maintenance
+from xml_aws_athena.state import StateStore
+import xml_aws_athena.write as Write
+
+
+def test_vacuum_retention_gold_bookmark(local_delta, monkeypatch):
+    state = StateStore(str(local_delta / "state.sqlite3"))
+    assert maintenance.vacuum_retention(state) == maintenance.VACUUM_RETENTION_HOURS
+
+    # Assert that the retention covers the changes after an old bookmark
+    state.set_value(maintenance.BOOKMARK, "3")
+    monkeypatch.setattr(
+        Write, "version_timestamp", lambda version: datetime.now() - timedelta(days=30)
+    )
+    assert maintenance.vacuum_retention(state) >= 30 * 24
+
+
+def test_gold_changes_unavailable(local_delta):
+    # table without change data feed, the bookmark cannot be read back
+    write_deltalake(Write.table_path, pa.table({"chave": ["a"]}))
+    write_deltalake(Write.table_path, pa.table({"chave": ["b"]}), mode="append")
+
+    state = StateStore(str(local_delta / "state.sqlite3"))
+    state.set_value(maintenance.BOOKMARK, "0")
+
+    # Assert that the load fails instead of silently reloading the whole table
+    with pytest.raises(RuntimeError, match="full_reload"):
+        gold.comand_gold_incremental(state)
+
+
+def table_with_partitions(months: int) -> pa.Table:
+    return pa.table(
+        {
+            "chave": [str(month) for month in range(months)],
+            "controle": ["saida"] * months,
+            "year": [2024] * months,
+            "month": list(range(1, months + 1)),
+        }
+    )
+
+
+def schedule_done(state: StateStore, table: str) -> None:
+    schedule = maintenance.Schedule(table, state)
+    for operation in ("optimize", "vacuum", "checkpoint"):
+        schedule.done(operation)
+
+
+def test_mergeable_small_files(local_delta):
+    partitions = ["controle", "year", "month"]
+    write_deltalake(
+        Write.table_path, table_with_partitions(12), partition_by=partitions
+    )
+
+    # Assert that one small file per partition is not mergeable
+    assert maintenance.delta_stats(check_vacuum=False)["small_files"] == 0
+
+    write_deltalake(Write.table_path, table_with_partitions(2), mode="append")
+
+    # Assert that only the partitions holding two small files count
+    stats = maintenance.delta_stats(check_vacuum=False)
+    assert stats["files"] == 14
+    assert stats["small_files"] == 4
+
+
+def test_maintain_silver_thresholds(local_delta, monkeypatch):
+    partitions = ["controle", "year", "month"]
+    write_deltalake(
+        Write.table_path, table_with_partitions(12), partition_by=partitions
+    )
+    state = StateStore(str(local_delta / "state.sqlite3"))
+    schedule_done(state, "silver")
+    monkeypatch.setattr(maintenance, "SMALL_FILES", 5)
+
+    # Assert that a compacted table within the cadence is left alone
+    assert maintenance.maintain_silver(changed=False, state=state) == []
+
+    write_deltalake(Write.table_path, table_with_partitions(2), mode="append")
+    assert maintenance.maintain_silver(changed=False, state=state) == []
+
+    write_deltalake(Write.table_path, table_with_partitions(2), mode="append")
+
+    # Assert that crossing the small files threshold compacts and vacuums
+    executed = maintenance.maintain_silver(changed=False, state=state)
+    assert executed == ["optimize", "vacuum"]
+    assert maintenance.delta_stats(check_vacuum=False)["small_files"] == 0
+    assert maintenance.maintain_silver(changed=False, state=state) == []
+
+
+def test_maintain_silver_cadence(local_delta, monkeypatch):
+    write_deltalake(Write.table_path, pa.table({"chave": ["a"]}))
+    state = StateStore(str(local_delta / "state.sqlite3"))
+
+    # Assert that every operation runs once when it never ran
+    executed = maintenance.maintain_silver(changed=False, state=state)
+    assert executed == ["optimize", "vacuum", "checkpoint"]
+    assert maintenance.maintain_silver(changed=False, state=state) == []
+
+    # Assert that an overdue operation runs on its own
+    state.set_watermark(
+        "maintenance:silver:checkpoint",
+        datetime.now() - maintenance.CADENCE - timedelta(minutes=1),
+    )
+    assert maintenance.maintain_silver(changed=False, state=state) == ["checkpoint"]
+
+    # Assert that the checkpoint follows the versions written since the last
+    monkeypatch.setattr(maintenance, "CHECKPOINT_VERSIONS", 2)
+    for chave in ("b", "c"):
+        write_deltalake(Write.table_path, pa.table({"chave": [chave]}), mode="append")
+    assert maintenance.maintain_silver(changed=False, state=state) == ["checkpoint"]
+
+
+class FakeAthena:
+    def __init__(self, small_files: int, snapshots: int) -> None:
+        self.results = {"$files": (100, small_files), "$snapshots": (snapshots,)}
+        self.queries = []
+
+    def execute(self, query: str):
+        self.queries.append(query.strip())
+        self.result = next(
+            (value for name, value in self.results.items() if name in query), None
+        )
+        return self
+
+    def fetchone(self):
+        return self.result
+
+
+def test_maintain_gold_thresholds(tmp_path):
+    state = StateStore(str(tmp_path / "state.sqlite3"))
+    schedule_done(state, "gold:db.notas")
+
+    # Assert that nothing runs below the thresholds and within the cadence
+    cliente = FakeAthena(small_files=0, snapshots=1)
+    assert maintenance.maintain_gold(cliente, "db", "notas", state) == []
+    assert "group by partition" in cliente.queries[0]
+
+    cliente = FakeAthena(small_files=maintenance.SMALL_FILES, snapshots=1)
+    executed = maintenance.maintain_gold(cliente, "db", "notas", state)
+    assert executed == ["optimize", "vacuum"]
+    assert cliente.queries[-2].startswith("OPTIMIZE db.notas")
+
+    cliente = FakeAthena(small_files=0, snapshots=maintenance.SNAPSHOTS)
+    assert maintenance.maintain_gold(cliente, "db", "notas", state) == ["vacuum"]
+
+    # Assert that an overdue optimize runs without crossing its threshold
+    state.set_watermark(
+        "maintenance:gold:db.notas:optimize",
+        datetime.now() - maintenance.CADENCE - timedelta(minutes=1),
+    )
+    cliente = FakeAthena(small_files=0, snapshots=1)
+    executed = maintenance.maintain_gold(cliente, "db", "notas", state)
+    assert executed == ["optimize", "vacuum"]
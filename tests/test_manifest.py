@@ -0,0 +1,30 @@
+import pytest
+from xml_aws_athena.cloud import Storage
+from xml_aws_athena.manifest import MANIFEST_NAME, UploadManifest
+
+
+def test_manifest_hit_miss_save(tmp_path):
+    moto = pytest.importorskip("moto")
+    key = "raw/TRANSFERENCIA/2025/04/01/nota_01_20250401.xml"
+
+    with moto.mock_aws():
+        client = Storage(region_name="sa-east-1")
+        client.create_bucket("teste-manifest")
+
+        # Assert that an unknown object is a miss until it is recorded
+        manifest = UploadManifest(client, "teste-manifest", str(tmp_path))
+        assert manifest.is_unchanged(key, b"<NFe/>") is False
+        manifest.record(key, b"<NFe/>")
+        assert manifest.is_unchanged(key, b"<NFe/>") is True
+        manifest.save()
+
+        # Assert that the manifest was written to the bucket and the local copy
+        folder = key.rpartition("/")[0]
+        assert client.get_object_file("teste-manifest", f"{folder}/{MANIFEST_NAME}")
+        assert (tmp_path / folder / MANIFEST_NAME).exists()
+
+        # Assert that a new run loads the digests back from the bucket
+        manifest = UploadManifest(client, "teste-manifest")
+        assert manifest.is_unchanged(key, b"<NFe/>") is True
+        assert manifest.is_unchanged(key, b"<NFe>1</NFe>") is False
+        assert (manifest.hits, manifest.misses) == (1, 1)
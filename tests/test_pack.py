@@ -0,0 +1,44 @@
+import pytest
+from datetime import datetime
+from benchmarks.generator import generate_rows
+from xml_aws_athena import raw
+from xml_aws_athena.cloud import Storage
+from xml_aws_athena.pack import PackReader, iter_packed_notes, upload_packs
+
+
+def test_pack_round_trip():
+    moto = pytest.importorskip("moto")
+    rows = list(generate_rows(6, items=2, days=2))
+
+    with moto.mock_aws():
+        client = Storage(region_name="sa-east-1")
+        client.create_bucket("teste-pack")
+        keys = upload_packs(client, "teste-pack", enumerate(rows), codec="gzip")
+
+        # Assert that one pack is written per controle and day
+        assert len(keys) == len({(row[4], row[3].date()) for row in rows})
+
+        # Assert that a single note comes back with a ranged GET
+        xml, chave, instatus, dtgravacao, controle = rows[3]
+        pack = next(key for key in keys if f"{dtgravacao:%Y/%m/%d}" in key)
+        reader = PackReader(client, "teste-pack", pack)
+        assert reader.get(chave, instatus) == rows[3]
+
+        # Assert that the prefix yields positioned rows, as command_silver reads them
+        notes = [*iter_packed_notes(client, "teste-pack", "raw/")]
+        assert [pos for pos, __ in notes] == list(range(len(rows)))
+        assert sorted(row[1] for __, row in notes) == sorted(row[1] for row in rows)
+
+
+def test_packed_rejects_per_object_options():
+    # Assert that options of the per note upload are not silently ignored
+    with pytest.raises(ValueError, match="packed"):
+        raw.comand_raw(
+            "s",
+            "db",
+            ["T"],
+            datetime.now(),
+            datetime.now(),
+            packed="gzip",
+            codec="gzip",
+        )
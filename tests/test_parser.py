@@ -0,0 +1,166 @@
+from pathlib import Path
+import pyarrow as pa
+from datetime import datetime
+from xml_aws_athena.parser import FileXml, ParseXml
+from xml_aws_athena.compression import decompress
+from xml_aws_athena.builder import SpillBuffer, iter_batches, normalize_dictionary
+from xml_aws_athena.schema import schema_compact, schema_nota
+from xml_aws_athena.fields import columns, to_datetime
+from benchmarks.generator import generate_rows
+
+xml_nota = (Path(__file__).parent / "data" / "nfe.xml").read_text(encoding="utf-8")
+
+
+def test_records_stream():
+    # Call the parser in both modes for a regular and an estorno note
+    for controle in ["TRANSFERENCIA", "ESTORNO-TRANSFERENCIA"]:
+        tree = list(ParseXml(controle, 1, xml_nota).records())
+        stream = list(ParseXml(controle, 1, xml_nota, stream=True).records())
+
+        # Assert that the streaming pass yields the same rows in the same order
+        assert stream == tree
+        assert [list(row) for row in stream] == [list(row) for row in tree]
+
+
+def test_records_stream_many_items():
+    ((xml, chave, __, __, controle),) = generate_rows(1, items=40, lots=1.0)
+    tree = list(ParseXml(controle, 1, xml).records())
+    stream = list(ParseXml(controle, 1, xml, stream=True).records())
+
+    # Assert that removing the parsed items keeps every row and the header
+    assert len(stream) == 40
+    assert stream == tree
+    assert {row["chave"] for row in stream} == {chave}
+
+
+def test_records_values():
+    rows = list(ParseXml("ESTORNO-TRANSFERENCIA", 1, xml_nota, stream=True).records())
+
+    # Assert that header and item columns were parsed
+    assert len(rows) == 2
+    assert rows[0]["chave"] == "35250412345678000190550010000012341000012345"
+    assert rows[0]["ref_chave"] == "35250312345678000190550010000011111000011111"
+    assert rows[0]["natureza_operacao"] == "TRANSFERENCIA DE MERCADORIA"
+    assert rows[0]["vl_base_icms"] == rows[0]["vl_base_cofins"] == 54.0
+    assert rows[1]["nome_prod"] == "ALCOOL EM GEL 70%"
+    assert "vl_base_pis" not in rows[1]
+
+
+def test_header_cached():
+    file = ParseXml("TRANSFERENCIA", 1, xml_nota)
+    header = file.header
+
+    # Assert that the header is extracted once and merged into every item
+    assert file.header is header
+    assert "ref_chave" not in header
+    for row in file.records():
+        assert row.items() >= header.items()
+
+
+def test_header_stream_first():
+    tree = ParseXml("ESTORNO-TRANSFERENCIA", 1, xml_nota)
+    stream = ParseXml("ESTORNO-TRANSFERENCIA", 1, xml_nota, stream=True)
+
+    # Assert that the stream header can be read before iterating the items
+    assert stream.header == tree.header
+    assert list(stream.records()) == list(tree.records())
+    assert list(stream.records()) == list(tree.records())
+
+
+def test_iter_batches():
+    files = (ParseXml("TRANSFERENCIA", 1, xml_nota, stream=True) for __ in range(5))
+    batches = list(iter_batches(files, max_rows=4))
+
+    # Assert that batches are typed with schema_compact and split by row count
+    assert [batch.num_rows for batch in batches] == [4, 4, 2]
+    assert all(batch.schema == schema_compact for batch in batches)
+    assert len(batches[0].column("controle").dictionary) == 1
+    assert batches[0].column("item").to_pylist() == [1, 2, 1, 2]
+
+
+def test_arrow_normalize_batch():
+    for controle in ["TRANSFERENCIA", "ESTORNO-TRANSFERENCIA"]:
+        cleaned = ParseXml(controle, 1, xml_nota).arrow()
+        raw = ParseXml(controle, 1, xml_nota, stream=True, clean=False).arrow()
+
+        # Assert that the Arrow kernels match the per-value clear_string
+        assert raw.equals(cleaned)
+
+    # Assert that the public table keeps plain strings unless asked otherwise
+    file = ParseXml("TRANSFERENCIA", 1, xml_nota)
+    assert file.arrow().schema == schema_nota
+    assert file.arrow(compact=True).schema == schema_compact
+    assert file.arrow(compact=True).cast(schema_nota).equals(file.arrow())
+
+
+def test_spill_buffer():
+    files = (ParseXml("TRANSFERENCIA", 1, xml_nota, stream=True) for __ in range(6))
+    batches = list(iter_batches(files, max_rows=4))
+    expected = pa.Table.from_batches(batches, schema=schema_compact)
+
+    for budget, spilled in [(None, False), (1, True)]:
+        with SpillBuffer(schema_compact, memory_budget=budget) as buffer:
+            for batch in batches:
+                buffer.write(batch)
+
+            # Assert that the batches are read back the same, spilled or not,
+            # on every pass
+            assert buffer.spilled is spilled
+            assert buffer.num_rows == 12
+            assert buffer.reader().read_all().equals(expected)
+            assert buffer.reader().read_all().equals(expected)
+
+            path = buffer.path if spilled else None
+
+        # Assert that the spill file is removed on exit
+        if path:
+            assert not Path(path).exists()
+
+
+def test_normalize_dictionary():
+    array = pa.array(["Álcool ", "ALCOOL", None, "Gel"]).dictionary_encode()
+    normalized = normalize_dictionary(array)
+
+    # Assert that values equal after cleaning share one dictionary entry
+    assert normalized.to_pylist() == ["ALCOOL", "ALCOOL", None, "GEL"]
+    assert normalized.dictionary.to_pylist() == ["ALCOOL", "GEL"]
+
+
+def test_export_passthrough():
+    file = FileXml(xml_nota, "1234", 1, datetime(2025, 4, 1), "TRANSF")
+
+    # Assert that the passthrough keeps the original payload and path
+    file_to, body = file.export_file_xml(passthrough=True)
+    assert file_to == "TRANSF/2025/04/01/1234_01_20250401.xml"
+    assert body.getvalue() == xml_nota.encode("utf-8")
+
+    # Assert that the compressed payload gets the codec suffix
+    file_to, body = file.export_file_xml(passthrough=True, codec="gzip")
+    assert file_to.endswith(".xml.gz")
+    assert decompress(body.getvalue(), "gzip") == xml_nota.encode("utf-8")
+
+
+def test_fields_spec():
+    # Assert that the field spec fills exactly the columns of schema_nota
+    assert sorted(columns()) == sorted(schema_nota.names)
+
+    # Assert that the ISO fast path and the dateutil fallback agree
+    assert to_datetime("2025-04-01") == datetime(2025, 4, 1)
+    assert to_datetime("01/04/2025") == datetime(2025, 1, 4)
+
+
+def test_generated_notes():
+    rows = list(generate_rows(10, items=3, estorno=0.5))
+
+    # Assert that the generator is deterministic
+    assert rows == list(generate_rows(10, items=3, estorno=0.5))
+
+    for xml, chave, instatus, __, controle in rows:
+        tree = list(ParseXml(controle, instatus, xml).records())
+        stream = list(ParseXml(controle, instatus, xml, stream=True).records())
+
+        # Assert that both modes read the generated items and access key
+        assert stream == tree
+        assert [row["item"] for row in tree] == [1, 2, 3]
+        assert tree[0]["chave"] == chave
+        assert ("ref_chave" in tree[0]) == controle.startswith("ESTORNO")
@@ -0,0 +1,88 @@
+import pytest
+from datetime import datetime
+from benchmarks.generator import generate_rows
+from xml_aws_athena import pipeline, raw
+from xml_aws_athena.cloud import Storage
+from xml_aws_athena.keys import key_column
+
+
+@pytest.fixture
+def local_pipeline(local_silver, monkeypatch):
+    """Pipeline against moto, a local Delta table and a stubbed source."""
+    moto = pytest.importorskip("moto")
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "teste")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "teste")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setattr(raw, "BUCKET_NAME", "teste-pipeline")
+    monkeypatch.setattr(pipeline, "BUCKET_NAME", "teste-pipeline")
+
+    with moto.mock_aws():
+        yield monkeypatch
+
+
+def test_command_pipeline(local_pipeline):
+    rows = list(generate_rows(12, items=2, start=datetime(2025, 4, 1)))
+    local_pipeline.setattr(pipeline, "iter_notes", lambda **kwargs: iter(rows))
+
+    reader = pipeline.command_pipeline(
+        "s",
+        "db",
+        ["TRANSFERENCIA"],
+        datetime(2025, 4, 1),
+        datetime(2025, 4, 1),
+        upload_workers=2,
+        parse_workers=2,
+        batch_notes=5,
+    )
+    table = reader.read_all()
+
+    # Assert that every item of every note reached the silver table once
+    assert table.num_rows == 24
+    assert len(set(key_column(table).to_pylist())) == 24
+    assert set(table.column("chave").to_pylist()) == {row[1] for row in rows}
+
+    # Assert that every note was uploaded to the raw layer
+    assert len(Storage().list_objects("teste-pipeline", "raw/")) == 12
+
+
+def test_command_pipeline_empty(local_pipeline):
+    local_pipeline.setattr(pipeline, "iter_notes", lambda **kwargs: iter([]))
+
+    # Assert that an empty source fails like comand_raw
+    with pytest.raises(ValueError, match="Nenhum registro"):
+        pipeline.command_pipeline(
+            "s", "db", ["T"], datetime(2025, 4, 1), datetime(2025, 4, 1)
+        )
+
+
+def test_command_pipeline_upload_failed(local_pipeline, caplog):
+    rows = list(generate_rows(6, items=2, start=datetime(2025, 4, 1)))
+    local_pipeline.setattr(pipeline, "iter_notes", lambda **kwargs: iter(rows))
+
+    failed = {rows[0][1], rows[3][1]}
+    upload_file = pipeline.upload_file
+
+    def flaky_upload(client, nota, **kwargs):
+        if nota[1][1] in failed:
+            return None
+        return upload_file(client, nota, **kwargs)
+
+    local_pipeline.setattr(pipeline, "upload_file", flaky_upload)
+
+    table = pipeline.command_pipeline(
+        "s",
+        "db",
+        ["TRANSFERENCIA"],
+        datetime(2025, 4, 1),
+        datetime(2025, 4, 1),
+        upload_workers=2,
+        parse_workers=2,
+    ).read_all()
+
+    # Assert that the notes missing from the raw layer skip the silver table
+    assert set(table.column("chave").to_pylist()) == {row[1] for row in rows} - failed
+    assert len(Storage().list_objects("teste-pipeline", "raw/")) == 4
+
+    # Assert that the failures are reported instead of a silent success
+    assert "2 notas falharam no upload" in caplog.text
@@ -0,0 +1,42 @@
+import pytest
+from datetime import datetime, timedelta
+from benchmarks.generator import generate_rows
+from xml_aws_athena import raw
+from xml_aws_athena.cloud import Storage
+from xml_aws_athena.state import StateStore
+
+
+@pytest.mark.parametrize("packed", [None, "gzip"])
+def test_incremental_upload_failure(tmp_path, monkeypatch, packed):
+    moto = pytest.importorskip("moto")
+    rows = list(generate_rows(6, estorno=0, start=datetime(2025, 4, 1), days=3))
+    failed = rows[2]
+
+    def put_object_file(self, body, bucket_name, object_key, *args):
+        if f"{failed[3]:%Y/%m/%d}" in object_key:
+            return False
+
+        return put(self, body, bucket_name, object_key, *args)
+
+    put = Storage.put_object_file
+    monkeypatch.setattr(Storage, "put_object_file", put_object_file)
+    monkeypatch.setattr(raw, "iter_notes_range", lambda **kwargs: iter(rows))
+    monkeypatch.setattr(raw, "BUCKET_NAME", "teste-raw")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+
+    with moto.mock_aws(), StateStore(str(tmp_path / "state.sqlite3")) as state:
+        start, end = datetime(2025, 4, 1), datetime(2025, 4, 3)
+        rst = raw.comand_raw(
+            "s", "db", ["T"], start, end, incremental=True, state=state, packed=packed
+        )
+
+        # Assert that the notes of the failed day are not returned nor marked
+        uploaded = {(row[1], row[2]) for __, row in rst}
+        day = [row for row in rows if row[3].date() == failed[3].date()]
+        assert len(uploaded) == len(rows) - len(day)
+        assert state.is_processed((row[1], row[2]) for row in rows) == uploaded
+
+        # Assert that the watermark stops at the oldest failed note
+        watermark = state.get_watermark("raw:dbnfe:T")
+        assert watermark == min(row[3] for row in day)
+        assert watermark < max(row[3] for row in rows) - timedelta(minutes=10)
@@ -0,0 +1,81 @@
+import pyarrow.compute as pc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from deltalake import DeltaTable
+from benchmarks.generator import generate_rows
+from xml_aws_athena import silver
+from xml_aws_athena.builder import SpillBuffer
+from xml_aws_athena.keys import KeyIndex, key_column
+from xml_aws_athena.schema import schema_compact
+import xml_aws_athena.write as Write
+
+
+def test_engines_same_output():
+    rst = [*enumerate(generate_rows(40, items=3, estorno=0.3))]
+    thread = silver.read_parquet_temp(rst, engine="thread")
+
+    with ProcessPoolExecutor(2) as executor:
+        process = silver.read_parquet_temp(rst, engine="process", executor=executor)
+
+    # Assert that both engines return the same rows in the same order
+    assert thread.num_rows == 120
+    assert process.equals(thread)
+
+
+def test_write_silver_spilled(local_delta):
+    rst = [*enumerate(generate_rows(10, items=2))]
+    index = KeyIndex()
+
+    def write(rows: list[tuple]) -> bool:
+        table = silver.read_parquet_temp(rows, compact=True)
+
+        with SpillBuffer(schema_compact, memory_budget=1) as buffer:
+            for batch in table.to_batches(max_chunksize=3):
+                buffer.write(batch)
+
+            assert buffer.spilled
+            return silver.write_silver(buffer, len(rows), index)
+
+    # Assert that the spilled batches are streamed to the append and the merge
+    assert write(rst[:6]) is False
+    assert write(rst[3:]) is True
+
+    result = DeltaTable(Write.table_path).to_pyarrow_table()
+    assert result.num_rows == 20
+    assert len(pc.unique(key_column(result))) == 20
+    assert DeltaTable(Write.table_path).version() == 2
+
+
+def data_versions() -> int:
+    """Delta commits that changed the rows, without the maintenance ones."""
+    return len(Write.data_commits(-1))
+
+
+def test_command_silver_batches(local_silver, monkeypatch):
+    monkeypatch.setattr(silver, "PARSE_NOTES", 2)
+    rst = [*enumerate(generate_rows(6, items=2))]
+    window = datetime(2025, 4, 1), datetime(2025, 4, 1)
+
+    # Assert that the rows threshold writes a batch after each parsed chunk
+    table = silver.command_silver(*window, rst, batch_rows=4).read_all()
+    assert table.num_rows == 12
+    assert data_versions() == 3
+
+    # Assert that the bytes threshold does the same, merging the existing rows
+    silver.command_silver(*window, rst[:4], batch_bytes=1)
+    assert data_versions() == 5
+
+
+def test_command_silver_single_commit(local_silver, monkeypatch):
+    monkeypatch.setattr(silver, "PARSE_NOTES", 2)
+    rst = [*enumerate(generate_rows(6, items=2))]
+    window = datetime(2025, 4, 1), datetime(2025, 4, 1)
+
+    # Assert that every chunk is staged and the new table created once
+    silver.command_silver(*window, rst[:4], batch_rows=1, single_commit=True)
+    assert data_versions() == 1
+
+    # Assert that new and existing rows take an append and a merge
+    table = silver.command_silver(*window, rst, batch_rows=1, single_commit=True)
+    assert data_versions() == 3
+    assert table.read_all().num_rows == 12
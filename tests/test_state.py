@@ -0,0 +1,29 @@
+from datetime import datetime
+from xml_aws_athena.state import StateStore
+
+
+def test_watermark(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+
+    with StateStore(path) as state:
+        # Assert that a missing watermark is None
+        assert state.get_watermark("raw:dbnfe:T") is None
+
+        state.set_watermark("raw:dbnfe:T", datetime(2025, 4, 1, 10))
+        state.set_watermark("raw:dbnfe:T", datetime(2025, 4, 2, 8))
+
+    # Assert that the last value is kept across connections
+    with StateStore(path) as state:
+        assert state.get_watermark("raw:dbnfe:T") == datetime(2025, 4, 2, 8)
+
+
+def test_processed(tmp_path):
+    pairs = [(f"{n:044d}", n % 3) for n in range(1000)]
+
+    with StateStore(str(tmp_path / "state.sqlite3")) as state:
+        state.mark_processed(pairs[:600])
+        state.mark_processed(pairs[:10])
+
+        # Assert that only the marked pairs are found, across several chunks
+        assert state.is_processed(pairs) == set(pairs[:600])
+        assert state.is_processed([]) == set()
@@ -0,0 +1,150 @@
+import duckdb
+import pytest
+import threading
+import pyarrow as pa
+import pyarrow.compute as pc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from deltalake import DeltaTable, write_deltalake
+from benchmarks.generator import generate_rows
+from xml_aws_athena import silver
+from xml_aws_athena.builder import SpillBuffer
+from xml_aws_athena.keys import KeyIndex, key_column
+from xml_aws_athena.schema import partition_by, schema_compact
+import xml_aws_athena.write as Write
+
+
+def test_concurrent_writers(local_delta):
+    writers = 8
+    rst = [*enumerate(generate_rows(writers * 2, items=2))]
+    tables = [
+        silver.read_parquet_temp(rst[pos::writers], compact=True)
+        for pos in range(writers)
+    ]
+    barrier = threading.Barrier(writers)
+
+    def write(pos: int) -> None:
+        index = KeyIndex(str(local_delta / f"keys_{pos}"))
+
+        with SpillBuffer(schema_compact) as buffer:
+            for batch in tables[pos].to_batches():
+                buffer.write(batch)
+
+            # every writer finds no table and races to create it
+            barrier.wait()
+            silver.write_silver(buffer, tables[pos].num_rows, index)
+
+    with ThreadPoolExecutor(max_workers=writers) as executor:
+        list(executor.map(write, range(writers)))
+
+    result = DeltaTable(Write.table_path).to_pyarrow_table()
+
+    # Assert that no writer overwrote or duplicated the rows of another
+    assert result.num_rows == writers * 2 * 2
+    assert len(pc.unique(key_column(result))) == result.num_rows
+
+
+def test_with_partitions():
+    data = pa.table(
+        {
+            "chave": ["a", "b", "c"],
+            "dh_emi": pa.array(
+                [datetime(2025, 4, 1), datetime(2024, 12, 31), None],
+                pa.timestamp("us"),
+            ),
+        }
+    )
+    result = Write.with_partitions(data)
+
+    # Assert that year/month come from dh_emi, null without a date
+    assert result.schema.field("year").type == pa.int16()
+    assert result.schema.field("month").type == pa.int8()
+    assert result.column("year").to_pylist() == [2025, 2024, None]
+    assert result.column("month").to_pylist() == [4, 12, None]
+
+    # Assert that tables already partitioned are left as they are
+    assert Write.with_partitions(result) is result
+
+
+def test_partition_predicate():
+    data = pa.table(
+        {
+            "controle": pa.array(["transf", "d'agua", "transf"]).dictionary_encode(),
+            "year": pa.array([2025, 2025, None], pa.int16()),
+            "month": pa.array([4, 3, None], pa.int8()),
+        }
+    )
+
+    # Assert that every touched partition is bound, nulls and quotes included
+    assert Write.partition_predicate(data, "x") == (
+        "x.controle in ('transf', 'd''agua') "
+        "and (x.year in (2025) or x.year is null) "
+        "and (x.month in (4, 3) or x.month is null)"
+    )
+
+
+@pytest.fixture
+def local_duckdb(monkeypatch):
+    """Plain DuckDB connection, without the extensions downloaded on use."""
+    con = duckdb.connect()
+    monkeypatch.setattr(Write, "duckdb_connection", lambda: con)
+    yield con
+    con.close()
+
+
+def test_read_filters(local_delta, local_duckdb):
+    data = pa.table(
+        {
+            "chave": ["a", "b", "c"],
+            "controle": ["saida", "entrada", "saida"],
+            "dh_emi": pa.array(
+                [datetime(2025, 4, 1, 10), datetime(2025, 4, 2), datetime(2025, 5, 1)],
+                pa.timestamp("us"),
+            ),
+        }
+    )
+    window = datetime(2025, 4, 1), datetime(2025, 4, 30)
+    dh_emi = "dh_emi between '2025-04-01 00:00:00.000' and '2025-04-30 23:59:59.999'"
+
+    def read(filters: list[str]) -> list[str]:
+        query = f"select chave from t where {' and '.join(filters)} order by chave"
+        reader = Write.query_reader(query, 1, t=Write.with_partitions(data))
+        return reader.read_all().column("chave").to_pylist()
+
+    # unpartitioned table: the window and the controles only
+    write_deltalake(Write.table_path, data)
+    assert Write.read_filters(*window) == [dh_emi]
+    assert Write.read_filters(*window, [" Saida"]) == [dh_emi, "controle in ('saida')"]
+
+    # Assert that the controles match however the caller writes them
+    assert read(Write.read_filters(*window, ["SAIDA ", "d'x"])) == ["a"]
+    assert read(Write.read_filters(*window)) == ["a", "b"]
+
+    # partitioned table: also the year/month bounds of the window
+    with Write.use_table(str(local_delta / "partitioned")):
+        write_deltalake(
+            Write.table_path, Write.with_partitions(data), partition_by=partition_by
+        )
+        filters = Write.read_filters(*window, ["Entrada"])
+
+        assert filters == [
+            dh_emi,
+            "controle in ('entrada')",
+            '"year" between 2025 and 2025',
+            '"month" between 4 and 4',
+        ]
+        assert read(filters) == ["b"]
+
+        # Assert that a window across years leaves the months unbounded
+        filters = Write.read_filters(datetime(2024, 11, 1), datetime(2025, 4, 30))
+        assert filters[1:] == ['"year" between 2024 and 2025']
+
+
+def test_query_reader(local_duckdb):
+    data = pa.table({"n": list(range(10))})
+    reader = Write.query_reader("select n from t where n % 2 = 0", 2, t=data)
+
+    # Assert that the result is streamed in batches of batch_size
+    batches = list(reader)
+    assert [batch.num_rows for batch in batches] == [2, 2, 1]
+    assert pa.Table.from_batches(batches).column("n").to_pylist() == [0, 2, 4, 6, 8]